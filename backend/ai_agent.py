@@ -2,59 +2,298 @@
 
 import os
 import json
+import asyncio
+import hashlib
+import logging
+import time
+import unicodedata
+from datetime import date
 from openai import AsyncOpenAI
 from dotenv import load_dotenv
 
+from cache import TTLCache
+import metrics
+
+logger = logging.getLogger(__name__)
+
 # 1. 加载同级目录下的 .env 文件
 load_dotenv()
 
+# 上游调用的超时（秒）和同时进行的最大请求数
+AI_TIMEOUT_SECONDS = float(os.getenv("AI_TIMEOUT_SECONDS", "20"))
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "8"))
+# 分析结果的内存缓存
+AI_CACHE_SIZE = int(os.getenv("AI_CACHE_SIZE", "2048"))
+AI_CACHE_TTL = float(os.getenv("AI_CACHE_TTL", "86400"))
+# 批量分析：默认并发数（不超过 AI_MAX_CONCURRENCY），单次最多多少条、每条最长多少字
+AI_BATCH_CONCURRENCY = int(os.getenv("AI_BATCH_CONCURRENCY", "4"))
+AI_BATCH_MAX_ITEMS = int(os.getenv("AI_BATCH_MAX_ITEMS", "100"))
+AI_BATCH_MAX_TEXT_LENGTH = int(os.getenv("AI_BATCH_MAX_TEXT_LENGTH", "500"))
+AI_BATCH_MAX_PACK = 20
+
 # 2. 初始化 DeepSeek 客户端
 # 即使我们用的是 DeepSeek，因为通过 OpenAI 协议兼容，所以用 AsyncOpenAI 库
 client = AsyncOpenAI(
     api_key=os.getenv("DEEPSEEK_API_KEY"),
-    base_url=os.getenv("DEEPSEEK_BASE_URL")
+    base_url=os.getenv("DEEPSEEK_BASE_URL"),
+    timeout=AI_TIMEOUT_SECONDS,
 )
 
-async def analyze_task_text(text: str):
-    print(f"🧠 AI 正在分析: {text}") # 打印日志，方便你在终端看进度
-    
-    # 3. 核心 Prompt (提示词)
-    # 我们要教会 AI 怎么提取信息，并强制它返回 JSON
-    system_prompt = """
+# 3. 核心 Prompt (提示词)
+# 我们要教会 AI 怎么提取信息，并强制它返回 JSON
+SYSTEM_PROMPT = """
     你是一个任务管理助手。请分析用户的输入，提取任务信息。
     必须严格返回合法的 JSON 格式，不要包含 Markdown 格式（如 ```json ... ```）。
-    
+
     JSON 结构要求如下：
     {
         "title": "简短的任务标题",
         "description": "详细描述(如果没有则留空)",
         "due_date": "YYYY-MM-DD (如果用户提到了日期，请基于当前时间推算，否则返回 null)",
-        "priority": 1 
+        "priority": 1
     }
-    
+
     关于 priority (优先级) 的定义：
     1 = 普通
     2 = 重要
     3 = 紧急
-    
+
     如果用户输入完全无法识别为任务（比如乱码），title 返回 "无法识别"。
     """
 
+# 多条输入打包成一次请求时追加的说明
+PACKED_PROMPT_SUFFIX = """
+    这次用户会一次给出多条输入，每行一条，行首是编号（如 "3. 明天买菜"）。
+    请对每一条分别按上面的结构分析，返回 {"items": [{"index": 编号, "title": ..., "description": ..., "due_date": ..., "priority": ...}, ...]}，
+    每条输入都要有对应的一项。
+    """
+
+# 提示词一改，版本号跟着变，旧的缓存结果自然失效
+PROMPT_VERSION = hashlib.sha256(SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+# --- 上游调用指标 ---
+# mode: single（单条）/ packed（多条合并成一次请求）
+AI_UPSTREAM_SECONDS = metrics.histogram(
+    "ai_upstream_duration_seconds", "上游 LLM 调用耗时（不含排队等信号量的时间）", ["mode"],
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0),
+)
+AI_UPSTREAM_ERRORS = metrics.counter("ai_upstream_errors_total", "上游 LLM 调用失败次数", ["mode", "error"])
+AI_TOKENS = metrics.counter("ai_tokens_total", "上游返回的 token 用量", ["kind"])
+AI_RESULTS = metrics.counter("ai_analysis_total", "分析请求按结果来源计数", ["source"])
+
+# --- 结果缓存 ---
+# 内存 LRU 在前，可选的持久化存储（由 main.py 注入，存在同一个数据库里）在后；
+# 相同输入的并发请求只会触发一次上游调用（single-flight）
+_memory_cache = TTLCache(maxsize=AI_CACHE_SIZE, ttl=AI_CACHE_TTL)
+_persistent_store = None
+_inflight = {}
+_semaphore = asyncio.Semaphore(AI_MAX_CONCURRENCY)
+
+
+def set_persistent_store(store):
+    """store 需要提供同步的 get(key) -> dict|None 和 set(key, dict)"""
+    global _persistent_store
+    _persistent_store = store
+
+
+def normalize_text(text: str) -> str:
+    # 全角/半角统一，去掉首尾空白，连续空白合并成一个空格
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def cache_key(normalized_text: str) -> str:
+    # "明天"、"周五" 这类相对日期每天含义不同，所以把日期也算进键里
+    raw = f"{PROMPT_VERSION}\n{date.today().isoformat()}\n{normalized_text}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def cache_stats() -> dict:
+    return {**_memory_cache.stats(), "inflight": len(_inflight)}
+
+
+async def _call_upstream(text: str, system_prompt: str = SYSTEM_PROMPT, mode: str = "single"):
+    async with _semaphore:
+        started = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(
+                client.chat.completions.create(
+                    model="deepseek-chat", # 或者 deepseek-v3，看官方文档支持
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": text},
+                    ],
+                    response_format={ "type": "json_object" }, # 关键：强制 JSON 模式
+                    temperature=0.1 # 温度越低，回答越严谨
+                ),
+                AI_TIMEOUT_SECONDS,
+            )
+            # 解析返回的内容
+            content = response.choices[0].message.content
+            result = json.loads(content)
+        except Exception as e:
+            AI_UPSTREAM_ERRORS.inc(mode, type(e).__name__)
+            raise
+        finally:
+            AI_UPSTREAM_SECONDS.observe(time.perf_counter() - started, mode)
+
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        AI_TOKENS.inc("prompt", amount=usage.prompt_tokens or 0)
+        AI_TOKENS.inc("completion", amount=usage.completion_tokens or 0)
+    return result
+
+
+async def _persistent_lookup(key: str):
+    # 只查持久化存储，命中后回填内存缓存
+    if _persistent_store is None:
+        return None
+    try:
+        stored = await asyncio.to_thread(_persistent_store.get, key)
+    except Exception as e:
+        logger.warning("⚠️ 读取 AI 缓存失败: %s", e)
+        return None
+    if stored is not None:
+        AI_RESULTS.inc("persistent_cache")
+        _memory_cache.set(key, stored)
+    return stored
+
+
+async def _cache_lookup(key: str):
+    cached = _memory_cache.get(key)
+    if cached is not None:
+        AI_RESULTS.inc("memory_cache")
+        return cached
+    return await _persistent_lookup(key)
+
+
+async def _cache_store(key: str, result: dict):
+    _memory_cache.set(key, result)
+    if _persistent_store is not None:
+        try:
+            await asyncio.to_thread(_persistent_store.set, key, result)
+        except Exception as e:
+            logger.warning("⚠️ 写入 AI 缓存失败: %s", e)
+
+
+async def _resolve(key: str, text: str):
+    # analyze_task_text 已经查过内存缓存了，这里只查持久化存储，免得一次未命中被记两次
+    stored = await _persistent_lookup(key)
+    if stored is not None:
+        return stored
+
+    logger.info("🧠 AI 正在分析: %s", text) # 打印日志，方便你在终端看进度
+    AI_RESULTS.inc("upstream")
     try:
-        response = await client.chat.completions.create(
-            model="deepseek-chat", # 或者 deepseek-v3，看官方文档支持
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": text},
-            ],
-            response_format={ "type": "json_object" }, # 关键：强制 JSON 模式
-            temperature=0.1 # 温度越低，回答越严谨
-        )
-        
-        # 解析返回的内容
-        content = response.choices[0].message.content
-        return json.loads(content)
+        result = await _call_upstream(text)
+    except Exception as e:
+        logger.warning("❌ AI 分析出错: %r", e)
+        return None
+
+    # 失败的结果不缓存，下次还会重试
+    await _cache_store(key, result)
+    return result
+
+
+async def analyze_task_text(text: str):
+    normalized = normalize_text(text)
+    key = cache_key(normalized)
+
+    cached = _memory_cache.get(key)
+    if cached is not None:
+        AI_RESULTS.inc("memory_cache")
+        return dict(cached)
+
+    # 同样的输入已经在请求上游了，就等那一次的结果
+    task = _inflight.get(key)
+    if task is not None:
+        AI_RESULTS.inc("coalesced")
+    else:
+        task = asyncio.ensure_future(_resolve(key, normalized))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+
+    # shield：某个调用方被取消时，不影响共享的那次上游请求
+    result = await asyncio.shield(task)
+    return dict(result) if result is not None else None
 
+
+async def _analyze_packed(items):
+    """items: [(下标, 文本)]，已缓存的直接返回，其余合并成一次上游请求"""
+    results, pending = [], []
+    for index, text in items:
+        normalized = normalize_text(text)
+        key = cache_key(normalized)
+        cached = await _cache_lookup(key)
+        if cached is not None:
+            results.append((index, dict(cached)))
+        else:
+            pending.append((index, normalized, key))
+    if not pending:
+        return results
+    if len(pending) == 1:
+        index, normalized, _ = pending[0]
+        return results + [(index, await analyze_task_text(normalized))]
+
+    prompt = "\n".join(f"{n}. {normalized}" for n, (_, normalized, _) in enumerate(pending, 1))
+    logger.info("🧠 AI 正在批量分析 %d 条", len(pending))
+    AI_RESULTS.inc("upstream_packed", amount=len(pending))
+    try:
+        data = await _call_upstream(prompt, SYSTEM_PROMPT + PACKED_PROMPT_SUFFIX, mode="packed")
+        parsed = {int(item.pop("index")): item for item in data.get("items", []) if isinstance(item, dict) and "index" in item}
     except Exception as e:
-        print(f"❌ AI 分析出错: {e}")
-        return None
\ No newline at end of file
+        logger.warning("❌ AI 批量分析出错: %r", e)
+        parsed = {}
+
+    missing = []
+    for n, (index, normalized, key) in enumerate(pending, 1):
+        result = parsed.get(n)
+        if result is None:
+            missing.append((index, normalized))
+            continue
+        await _cache_store(key, result)
+        results.append((index, dict(result)))
+
+    # 模型漏了某几条（或整次批量请求失败）时，这几条退回逐条分析，不能直接给 None
+    if missing:
+        logger.warning("⚠️ 批量分析缺少 %d/%d 条结果，改为逐条分析", len(missing), len(pending))
+        fallback = await asyncio.gather(*(analyze_task_text(normalized) for _, normalized in missing))
+        results.extend((index, result) for (index, _), result in zip(missing, fallback))
+    return results
+
+
+async def analyze_task_texts(texts, concurrency: int = None, pack_size: int = 1):
+    """批量分析：异步生成器，每条结果一出来就产出 (下标, 结果)，顺序不保证。
+
+    concurrency 是本批同时在途的上游请求数，全局仍受 AI_MAX_CONCURRENCY 限制；
+    pack_size > 1 时每 pack_size 条合并成一次请求，省掉重复的系统提示词开销。
+    """
+    concurrency = max(1, min(concurrency or AI_BATCH_CONCURRENCY, AI_MAX_CONCURRENCY))
+    pack_size = max(1, min(pack_size, AI_BATCH_MAX_PACK))
+    limiter = asyncio.Semaphore(concurrency)
+
+    items = [(index, text) for index, text in enumerate(texts) if text and text.strip()]
+    # 空行不调用上游，直接返回 None
+    for index, text in enumerate(texts):
+        if not (text and text.strip()):
+            yield index, None
+
+    async def run_single(index, text):
+        async with limiter:
+            return [(index, await analyze_task_text(text))]
+
+    async def run_packed(chunk):
+        async with limiter:
+            return await _analyze_packed(chunk)
+
+    if pack_size == 1:
+        jobs = [asyncio.ensure_future(run_single(index, text)) for index, text in items]
+    else:
+        jobs = [asyncio.ensure_future(run_packed(items[i:i + pack_size])) for i in range(0, len(items), pack_size)]
+    try:
+        for job in asyncio.as_completed(jobs):
+            for index, result in await job:
+                yield index, result
+    finally:
+        # 调用方提前退出（比如客户端断开）时，取消还没跑完的请求
+        for job in jobs:
+            job.cancel()
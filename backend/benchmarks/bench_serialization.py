@@ -0,0 +1,95 @@
+# 文件路径: backend/benchmarks/bench_serialization.py
+# 任务列表序列化的微基准：对比 "ORM 对象 + jsonable_encoder" 和 "列元组 + orjson" 两条路径
+#
+# 用法（在 backend 目录下）：
+#   python benchmarks/bench_serialization.py --tasks 10000 --repeat 5
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="任务列表序列化微基准")
+    parser.add_argument("--tasks", type=int, default=10000, help="任务数量")
+    parser.add_argument("--repeat", type=int, default=5, help="每种方式重复次数，取中位数")
+    args = parser.parse_args()
+
+    # 导入 main 之前指定临时数据库和工作目录，避免碰到开发用的数据库
+    workdir = tempfile.mkdtemp(prefix="vibe-bench-")
+    os.chdir(workdir)
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/bench.db"
+    os.environ.setdefault("DEEPSEEK_API_KEY", "bench")
+    sys.path.insert(0, BACKEND_DIR)
+    import main as app_main
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+
+    db = app_main.SessionLocal()
+    user = app_main.User(username="bench", hashed_password="x")
+    db.add(user)
+    db.commit()
+    now = datetime.utcnow()
+    db.execute(app_main.insert(app_main.Task), [
+        {
+            "content": f"任务 {i} 买牛奶 learn python",
+            "category": "日常",
+            "priority": 1 + i % 3,
+            "deadline": now + timedelta(days=i % 30) if i % 2 else None,
+            "sort_order": i,
+            "version": 1,
+            "owner_id": user.id,
+        }
+        for i in range(args.tasks)
+    ])
+    db.commit()
+    user_id = user.id
+    db.close()
+
+    def before():
+        # 原来的路径：查询 ORM 对象，FastAPI 用 jsonable_encoder 逐个遍历再 json.dumps
+        session = app_main.SessionLocal()
+        try:
+            tasks = session.query(app_main.Task).filter(app_main.Task.owner_id == user_id).order_by(app_main.Task.sort_order).all()
+            return JSONResponse(jsonable_encoder(tasks)).body
+        finally:
+            session.close()
+
+    def after():
+        # 快速路径：只查列，拼字典，orjson 编码
+        session = app_main.SessionLocal()
+        try:
+            rows = (
+                session.query(*app_main.TASK_COLUMNS)
+                .filter(app_main.Task.owner_id == user_id)
+                .order_by(app_main.Task.sort_order, app_main.Task.id)
+                .all()
+            )
+            return app_main.FastJSONResponse(app_main.task_rows_to_dicts(rows)).body
+        finally:
+            session.close()
+
+    results = {}
+    for name, func in (("orm+jsonable_encoder", before), ("columns+orjson", after)):
+        func()  # 预热
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            body = func()
+            timings.append(time.perf_counter() - start)
+        results[name] = statistics.median(timings)
+        per_10k = results[name] * 10000 / args.tasks * 1000
+        print(f"{name:>22}: {results[name] * 1000:8.1f} ms  ({per_10k:.1f} ms / 10k 任务, {len(body) / 1024:.0f} KiB)")
+
+    print(f"{'speedup':>22}: {results['orm+jsonable_encoder'] / results['columns+orjson']:.1f}x"
+          f"  (orjson {'已安装' if app_main.orjson else '未安装，使用标准 json'})")
+
+
+if __name__ == "__main__":
+    main()
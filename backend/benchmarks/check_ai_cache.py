@@ -0,0 +1,126 @@
+# 文件路径: backend/benchmarks/check_ai_cache.py
+# /ai/analyze 缓存与请求合并的检查：接口打到本地假 LLM 服务（fake_llm.py），
+# 对比 "不同输入（每次都走上游）"、"相同输入并发（合并成一次上游调用）"、
+# "重复输入（内存缓存）"、"重启后（持久化缓存）" 四种情况的上游调用次数和延迟。
+#
+# 用法（在 backend 目录下）：
+#   python benchmarks/check_ai_cache.py --requests 20 --llm-latency 0.2
+# 任何一项不满足都以退出码 1 结束。
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from fake_llm import FakeLLMServer
+
+
+class CheckFailed(Exception):
+    pass
+
+
+def check(condition, message: str):
+    if not condition:
+        raise CheckFailed(message)
+
+
+async def timed_batch(client, texts):
+    """并发请求 texts，返回每个请求的耗时（秒）"""
+    async def one(text):
+        start = time.perf_counter()
+        response = await client.post("/ai/analyze", json={"text": text})
+        check(response.status_code == 200, f"/ai/analyze 返回 {response.status_code}: {response.text}")
+        return time.perf_counter() - start
+    return await asyncio.gather(*(one(text) for text in texts))
+
+
+async def run_checks(main, llm, requests: int, latency: float):
+    import httpx
+    import ai_agent
+
+    rows = []
+
+    async def scenario(name, texts):
+        """跑一批请求，记录上游调用次数和 p50，返回 (调用次数, p50 毫秒, 整批耗时秒)"""
+        before = llm.calls
+        started = time.perf_counter()
+        timings = await timed_batch(client, texts)
+        wall = time.perf_counter() - started
+        calls = llm.calls - before
+        p50 = statistics.median(timings) * 1000
+        rows.append((name, len(texts), calls, p50))
+        return calls, p50, wall
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://check", timeout=60) as client:
+        # 1. 不同输入：每条都要走上游，作为对照
+        distinct = min(requests, ai_agent.AI_MAX_CONCURRENCY)
+        calls, cold_p50, _ = await scenario("不同输入（未缓存）", [f"第 {i} 件事：明天交报告" for i in range(distinct)])
+        check(calls == distinct, f"{distinct} 条不同输入应调用上游 {distinct} 次，实际 {calls}")
+        check(cold_p50 >= latency * 1000 * 0.9, f"未缓存的请求应至少等一次上游（{latency * 1000:.0f} ms），实际 p50 {cold_p50:.1f} ms")
+
+        # 2. 相同输入并发：合并成一次上游调用，整批只等一次上游的时间
+        calls, _, wall = await scenario("相同输入并发", ["下周一上午十点开周会"] * requests)
+        check(calls == 1, f"{requests} 个相同的并发请求应只调用上游 1 次，实际 {calls}")
+        check(wall < latency * 2, f"合并后整批应在约一次上游耗时内完成，实际 {wall * 1000:.0f} ms")
+
+        # 3. 重复输入（首尾空白不同也算同一条）：直接命中内存缓存
+        repeats = ["下周一上午十点开周会", "  下周一上午十点开周会 ", "下周一上午十点开周会\n"] * max(1, requests // 3)
+        calls, cached_p50, _ = await scenario("重复输入（内存缓存）", repeats)
+        check(calls == 0, f"缓存命中不应调用上游，实际调用了 {calls} 次")
+        check(cached_p50 < cold_p50 / 5, f"缓存命中 p50 {cached_p50:.1f} ms 应远低于未缓存的 {cold_p50:.1f} ms")
+
+        # 4. 清空内存缓存（相当于进程重启）：由持久化缓存兜底，仍不调用上游
+        persistent = ai_agent._persistent_store is not None
+        if persistent:
+            ai_agent._memory_cache.clear()
+            calls, _, _ = await scenario("重启后（持久化缓存）", ["下周一上午十点开周会"] * requests)
+            check(calls == 0, f"持久化缓存命中不应调用上游，实际调用了 {calls} 次")
+
+        # 每个请求只查一次内存缓存：未命中数 = 场景 1 + 场景 2 (+ 场景 4) 的请求数
+        expected_misses = distinct + requests + (requests if persistent else 0)
+        stats = ai_agent.cache_stats()
+        check(stats["misses"] == expected_misses, f"内存缓存未命中应为 {expected_misses}，实际 {stats['misses']}")
+        check(stats["hits"] == len(repeats), f"内存缓存命中应为 {len(repeats)}，实际 {stats['hits']}")
+
+    print(f"\n{'场景':<20} {'请求数':>6} {'上游调用':>8} {'p50 ms':>10}")
+    for name, count, calls, p50 in rows:
+        print(f"{name:<20} {count:>6} {calls:>8} {p50:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/ai/analyze 缓存与请求合并检查")
+    parser.add_argument("--requests", type=int, default=20, help="每个场景的并发请求数")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="假 LLM 每次请求的延迟（秒）")
+    args = parser.parse_args()
+
+    # 导入 main 之前配置临时数据库和假 LLM 地址
+    llm = FakeLLMServer(latency=args.llm_latency).start()
+    workdir = tempfile.mkdtemp(prefix="vibe-ai-cache-")
+    os.chdir(workdir)
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/ai.db"
+    os.environ["DEEPSEEK_API_KEY"] = "check"
+    os.environ["DEEPSEEK_BASE_URL"] = llm.base_url
+    sys.path.insert(0, BACKEND_DIR)
+
+    try:
+        import main as app_main
+        asyncio.run(run_checks(app_main, llm, args.requests, args.llm_latency))
+    except CheckFailed as e:
+        print(f"❌ {e}")
+        return 1
+    finally:
+        llm.stop()
+    print("\n✅ 相同输入只调用一次上游，缓存命中的延迟远低于上游调用")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+# 文件路径: backend/benchmarks/check_events.py
+# 任务事件推送（SSE）的并发检查，两部分：
+# 1. 直接驱动 Broadcaster / MemoryBackend：N 个订阅者都收到每条事件（发布方在别的线程），
+#    队列溢出时只剩一条 resync，退出订阅后 subscriber_count() 回到 0；
+# 2. 在本地端口起一个 uvicorn 跑 main.app，开 N 条 /tasks/events 连接，通过 HTTP 创建任务，
+#    检查每条连接都收到每个 created 事件，断开后订阅数回到 0。
+#
+# 用法（在 backend 目录下）：
+#   python benchmarks/check_events.py --subscribers 200 --events 5
+# 任何一项不满足都以退出码 1 结束。
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from events import Broadcaster, MemoryBackend, RESYNC_MESSAGE
+
+
+class CheckFailed(Exception):
+    pass
+
+
+def check(condition, message: str):
+    if not condition:
+        raise CheckFailed(message)
+
+
+async def wait_until(predicate, timeout: float, message: str):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise CheckFailed(message)
+        await asyncio.sleep(0.02)
+
+
+# --- 1. 广播器本身 ---
+async def check_broadcaster(subscribers: int, events: int):
+    backend = MemoryBackend()
+    broadcaster = Broadcaster(backend, max_queue=events + 10)
+    received = [[] for _ in range(subscribers)]
+    ready = asyncio.Event()
+    joined = 0
+
+    async def subscriber(i):
+        nonlocal joined
+        async with broadcaster.subscribe(1) as subscription:
+            joined += 1
+            if joined == subscribers:
+                ready.set()
+            while len(received[i]) < events:
+                message = await subscription.get(timeout=5)
+                check(message is not None, f"订阅者 {i} 等事件超时，只收到 {len(received[i])} 条")
+                received[i].append(json.loads(message)["n"])
+
+    tasks = [asyncio.create_task(subscriber(i)) for i in range(subscribers)]
+    await asyncio.wait_for(ready.wait(), 5)
+    check(backend.subscriber_count() == subscribers, f"订阅数应为 {subscribers}，实际 {backend.subscriber_count()}")
+
+    # 同步接口是在线程池里发布的，这里也从别的线程发
+    publisher = threading.Thread(target=lambda: [broadcaster.publish(1, {"n": n}) for n in range(events)])
+    publisher.start()
+    publisher.join()
+    await asyncio.gather(*tasks)
+    for i, got in enumerate(received):
+        check(got == list(range(events)), f"订阅者 {i} 收到 {got}，应为 0..{events - 1} 按顺序")
+    check(backend.subscriber_count() == 0, f"全部退出后订阅数应为 0，实际 {backend.subscriber_count()}")
+
+    # 慢客户端：不读队列，连发超过队列长度的事件，读出来应该只有一条 resync
+    slow = Broadcaster(MemoryBackend(), max_queue=5)
+    async with slow.subscribe(1) as subscription:
+        for n in range(20):
+            slow.publish(1, {"n": n})
+        await asyncio.sleep(0.05)  # 让 call_soon_threadsafe 排进来的投递跑完
+        check(await subscription.get(timeout=0.2) == RESYNC_MESSAGE, "队列溢出后第一条应是 resync")
+        check(await subscription.get(timeout=0.2) is None, "resync 之后不应再有积压的事件")
+        check(subscription.overflows == 1, f"只应溢出一次，实际 {subscription.overflows} 次")
+        # resync 被读走以后，新事件照常投递
+        slow.publish(1, {"n": 20})
+        await asyncio.sleep(0.05)
+        check(json.loads(await subscription.get(timeout=0.2) or "{}").get("n") == 20, "resync 之后的新事件应正常收到")
+    check(slow.backend.subscriber_count() == 0, "慢客户端退出后订阅数应为 0")
+    print(f"✅ Broadcaster: {subscribers} 个订阅者各收到 {events} 条事件，溢出后只剩一条 resync")
+
+
+# --- 2. 通过 HTTP 的 /tasks/events ---
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def check_sse_endpoint(main, subscribers: int, events: int):
+    import httpx
+    import uvicorn
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    await wait_until(lambda: server.started, 10, "uvicorn 没有启动")
+    backend = main.broadcaster.backend
+    base_url = f"http://127.0.0.1:{port}"
+
+    try:
+        limits = httpx.Limits(max_connections=subscribers + 10, max_keepalive_connections=0)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+            await client.post("/register", json={"username": "events", "password": "events"})
+            token = (await client.post("/token", data={"username": "events", "password": "events"})).json()["access_token"]
+            headers = {"Authorization": f"Bearer {token}"}
+
+            created = [[] for _ in range(subscribers)]
+            ready = [False] * subscribers
+
+            async def listen(i):
+                async with client.stream("GET", "/tasks/events", params={"token": token}) as response:
+                    check(response.status_code == 200, f"连接 {i} 返回 {response.status_code}")
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data: "):
+                            continue
+                        event = json.loads(line[len("data: "):])
+                        if event["type"] == "ready":
+                            ready[i] = True
+                        elif event["type"] == "created":
+                            created[i].extend(event["ids"])
+                            if len(created[i]) >= events:
+                                return
+
+            listeners = [asyncio.create_task(listen(i)) for i in range(subscribers)]
+            await wait_until(lambda: all(ready), 30, f"只有 {sum(ready)}/{subscribers} 条连接收到 ready")
+            check(backend.subscriber_count() == subscribers, f"订阅数应为 {subscribers}，实际 {backend.subscriber_count()}")
+
+            task_ids = []
+            for n in range(events):
+                response = await client.post("/tasks/", json={"content": f"事件检查 {n}"}, headers=headers)
+                task_ids.append(response.json()["id"])
+            await asyncio.wait_for(asyncio.gather(*listeners), 30)
+            for i, got in enumerate(created):
+                check(got == task_ids, f"连接 {i} 收到 {got}，应为 {task_ids}")
+
+        # 客户端全部断开，服务端应在一个心跳周期左右释放所有订阅
+        await wait_until(lambda: backend.subscriber_count() == 0, 10,
+                         f"断开后订阅数没有回到 0（还剩 {backend.subscriber_count()}）")
+    finally:
+        server.should_exit = True
+        thread.join(10)
+    print(f"✅ /tasks/events: {subscribers} 条连接各收到 {events} 个 created 事件，断开后订阅数回到 0")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="任务事件推送并发检查")
+    parser.add_argument("--subscribers", type=int, default=200, help="并发订阅者数量")
+    parser.add_argument("--events", type=int, default=5, help="发布的事件数")
+    args = parser.parse_args()
+
+    # 导入 main 之前指定临时数据库，心跳调短让服务端尽快发现断开的连接
+    workdir = tempfile.mkdtemp(prefix="vibe-events-")
+    os.chdir(workdir)
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/events.db"
+    os.environ.setdefault("DEEPSEEK_API_KEY", "check")
+    os.environ["EVENT_HEARTBEAT_SECONDS"] = "0.5"
+    os.environ["EVENT_QUEUE_SIZE"] = str(max(100, args.events * 2))
+
+    try:
+        asyncio.run(check_broadcaster(args.subscribers, args.events))
+        import main as app_main
+        asyncio.run(check_sse_endpoint(app_main, args.subscribers, args.events))
+    except CheckFailed as e:
+        print(f"❌ {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+# 文件路径: backend/benchmarks/fake_llm.py
+# 本地假 LLM 服务：兼容 OpenAI chat.completions 接口，固定延迟后返回一个合法的任务 JSON，
+# 让 /ai/analyze 的压测不依赖外网和真实额度
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeLLMServer:
+    def __init__(self, latency: float = 0.05, host: str = "127.0.0.1", port: int = 0):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("content-length", 0))) or b"{}")
+                with fake._lock:
+                    fake.calls += 1
+                time.sleep(fake.latency)
+
+                text = body.get("messages", [{}])[-1].get("content", "")
+                content = json.dumps(
+                    {"title": text[:20], "description": "", "due_date": None, "priority": 2},
+                    ensure_ascii=False,
+                )
+                payload = json.dumps({
+                    "id": "fake",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "fake"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }],
+                    # 粗略按字符数估算 token，够指标统计用
+                    "usage": {"prompt_tokens": len(text), "completion_tokens": len(content), "total_tokens": len(text) + len(content)},
+                }).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="本地假 LLM 服务")
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--latency", type=float, default=0.05, help="每次请求的固定延迟（秒）")
+    args = parser.parse_args()
+    server = FakeLLMServer(args.latency, port=args.port).start()
+    print(f"🤖 假 LLM 服务已启动: {server.base_url}（DEEPSEEK_BASE_URL 设成这个地址即可）")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,129 @@
+# 文件路径: backend/events.py
+# 任务变更推送：进程内广播器 + 可替换的分发后端
+#
+# 写接口提交事务后调用 broadcaster.publish(user_id, event)，
+# 订阅者（SSE 连接）各自持有一个有界队列。慢客户端的队列满了以后不会阻塞发布方，
+# 而是清空队列改发一条 {"type": "resync"}，让客户端自己做一次增量/全量同步。
+#
+# MemoryBackend 只在当前进程内分发；多个 uvicorn worker 需要共享时，
+# 实现一个基于 Redis pub/sub 之类的 BroadcastBackend 传给 Broadcaster 即可。
+
+import asyncio
+import itertools
+import json
+import threading
+from contextlib import asynccontextmanager
+
+RESYNC_MESSAGE = json.dumps({"type": "resync"})
+
+
+class BroadcastBackend:
+    """分发后端接口：按频道把字符串消息投递给回调，回调可能在任意线程被调用"""
+
+    def publish(self, channel: str, message: str):
+        raise NotImplementedError
+
+    def subscribe(self, channel: str, callback) -> int:
+        raise NotImplementedError
+
+    def unsubscribe(self, channel: str, handle: int):
+        raise NotImplementedError
+
+
+class MemoryBackend(BroadcastBackend):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = {}
+        self._ids = itertools.count(1)
+
+    def publish(self, channel, message):
+        with self._lock:
+            callbacks = list(self._channels.get(channel, {}).values())
+        for callback in callbacks:
+            callback(message)
+
+    def subscribe(self, channel, callback):
+        with self._lock:
+            handle = next(self._ids)
+            self._channels.setdefault(channel, {})[handle] = callback
+            return handle
+
+    def unsubscribe(self, channel, handle):
+        with self._lock:
+            callbacks = self._channels.get(channel)
+            if callbacks is None:
+                return
+            callbacks.pop(handle, None)
+            if not callbacks:
+                del self._channels[channel]
+
+    def subscriber_count(self, channel=None):
+        with self._lock:
+            if channel is not None:
+                return len(self._channels.get(channel, ()))
+            return sum(len(callbacks) for callbacks in self._channels.values())
+
+
+class Subscription:
+    """单个连接的有界消息队列，只能在创建它的事件循环里读取"""
+
+    def __init__(self, loop, max_queue: int):
+        self._loop = loop
+        self._queue = asyncio.Queue(max_queue)
+        self._resync_pending = False
+        self.overflows = 0
+
+    def push(self, message: str):
+        # 发布方可能在线程池里（同步接口），统一切回订阅者所在的事件循环
+        try:
+            self._loop.call_soon_threadsafe(self._deliver, message)
+        except RuntimeError:
+            # 事件循环已经关闭，连接也就不存在了
+            pass
+
+    def _deliver(self, message: str):
+        if self._resync_pending:
+            # 客户端收到 resync 后会整体同步一次，在那之前的新事件都不用再排队
+            return
+        try:
+            self._queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # 客户端跟不上：丢掉积压的消息，只留一条 resync
+            self.overflows += 1
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._queue.put_nowait(RESYNC_MESSAGE)
+            self._resync_pending = True
+
+    async def get(self, timeout: float = None):
+        """等待下一条消息，超时返回 None（用来发心跳）"""
+        try:
+            message = await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        if message is RESYNC_MESSAGE:
+            self._resync_pending = False
+        return message
+
+
+class Broadcaster:
+    def __init__(self, backend: BroadcastBackend = None, max_queue: int = 100):
+        self.backend = backend or MemoryBackend()
+        self.max_queue = max_queue
+
+    @staticmethod
+    def channel(user_id: int) -> str:
+        return f"user:{user_id}"
+
+    def publish(self, user_id: int, event: dict):
+        self.backend.publish(self.channel(user_id), json.dumps(event, ensure_ascii=False))
+
+    @asynccontextmanager
+    async def subscribe(self, user_id: int):
+        subscription = Subscription(asyncio.get_running_loop(), self.max_queue)
+        channel = self.channel(user_id)
+        handle = self.backend.subscribe(channel, subscription.push)
+        try:
+            yield subscription
+        finally:
+            self.backend.unsubscribe(channel, handle)
@@ -0,0 +1,232 @@
+# 文件路径: backend/instrumentation.py
+# 请求级性能埋点：
+# 1. RequestMetricsMiddleware（纯 ASGI 中间件）按路由模板记录请求耗时直方图和请求数；
+# 2. instrument_engine() 挂在 SQLAlchemy 引擎事件上，统计每个请求执行了多少条 SQL、花了多少时间，
+#    超过 REQUEST_QUERY_BUDGET 条时打一条警告（N+1 查询之类的问题一眼就能看到）；
+# 3. 可选的采样分析器：PROFILE_REQUESTS=1 时，带 "X-Profile: 1" 请求头的请求（或按
+#    PROFILE_SAMPLE_RATE 随机抽中的请求）会被采样，折叠栈写到 PROFILE_DIR，
+#    可以直接用 speedscope / flamegraph.pl 打开。
+#
+# 当前请求的统计放在 contextvar 里：同步接口跑在线程池、异步引擎跑在 greenlet 里，
+# 都会带着请求的 context，所以 SQL 事件回调能找到自己属于哪个请求。
+
+import contextvars
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import event
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+REQUEST_QUERY_BUDGET = int(os.getenv("REQUEST_QUERY_BUDGET", "50"))
+PROFILE_REQUESTS = os.getenv("PROFILE_REQUESTS", "0") == "1"
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+# 没匹配到路由的请求（404 扫描之类）统一记成一个标签，避免标签数量失控
+UNMATCHED_ROUTE = "<unmatched>"
+
+HTTP_REQUESTS = metrics.counter(
+    "http_requests_total", "HTTP 请求数", ["method", "route", "status"]
+)
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    "http_request_duration_seconds", "HTTP 请求耗时（流式响应算到最后一块发完）", ["method", "route"]
+)
+HTTP_REQUEST_QUERIES = metrics.histogram(
+    "http_request_db_queries", "单个请求执行的 SQL 条数", ["method", "route"],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+HTTP_REQUEST_DB_SECONDS = metrics.histogram(
+    "http_request_db_seconds", "单个请求花在 SQL 上的时间", ["method", "route"]
+)
+DB_QUERY_SECONDS = metrics.histogram(
+    "db_query_duration_seconds", "单条 SQL 的执行耗时", ["engine"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+DB_QUERY_ERRORS = metrics.counter("db_query_errors_total", "执行出错的 SQL 条数", ["engine"])
+QUERY_BUDGET_EXCEEDED = metrics.counter(
+    "http_request_query_budget_exceeded_total", "SQL 条数超过预算的请求数", ["method", "route"]
+)
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+_current_request = contextvars.ContextVar("current_request_stats", default=None)
+
+
+def current_request_stats():
+    """当前请求的统计，不在请求里（启动脚本、后台任务）时返回 None"""
+    return _current_request.get()
+
+
+# --- SQL 计数 ---
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _make_after_cursor_execute(engine_label: str):
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_start_time"].pop()
+        elapsed = time.perf_counter() - started
+        DB_QUERY_SECONDS.observe(elapsed, engine_label)
+        stats = _current_request.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+    return after_cursor_execute
+
+
+def _make_handle_error(engine_label: str):
+    def handle_error(context):
+        DB_QUERY_ERRORS.inc(engine_label)
+        conn = context.connection
+        if conn is not None and conn.info.get("query_start_time"):
+            conn.info["query_start_time"].pop()
+    return handle_error
+
+
+def instrument_engine(engine, label: str = "sync"):
+    """给同步引擎（异步引擎传 async_engine.sync_engine）挂上 SQL 计时"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _make_after_cursor_execute(label))
+    event.listen(engine, "handle_error", _make_handle_error(label))
+
+
+# --- 采样分析器 ---
+# 这些模块里的栈顶说明线程在空等（线程池等任务、事件循环等 IO），不计入样本
+_IDLE_FILES = ("threading.py", "queue.py", "selectors.py")
+
+
+def _is_idle(frame) -> bool:
+    return frame.f_code.co_filename.endswith(_IDLE_FILES)
+
+
+def _fold_stack(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    """后台线程每隔 interval 秒抓一次所有线程的调用栈，按折叠栈累计次数。
+
+    同步接口跑在线程池里，无法只盯一个线程，所以抓的是整个进程；
+    同时在跑的其它请求也会混进来，适合在低并发的环境里针对单个慢请求使用。
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident != me and not _is_idle(frame):
+                    self.samples[_fold_stack(frame)] += 1
+
+    def write(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+# 同一时间只跑一个采样器，互相重叠的样本没法区分
+_profiler_lock = threading.Lock()
+
+
+def _should_profile(scope) -> bool:
+    if not PROFILE_REQUESTS:
+        return False
+    for name, value in scope.get("headers", ()):
+        if name == b"x-profile":
+            return value == b"1"
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def _save_profile(profiler: SamplingProfiler, method: str, route: str, elapsed: float):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+    path = os.path.join(PROFILE_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{method}-{slug}-{elapsed * 1000:.0f}ms.folded")
+    profiler.write(path)
+    logger.info("🔬 %s %s 采样 %d 次，已写入 %s", method, route, sum(profiler.samples.values()), path)
+
+
+# --- 中间件 ---
+class RequestMetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = _current_request.set(stats)
+        status_code = 500
+        profiler = None
+        if _should_profile(scope) and _profiler_lock.acquire(blocking=False):
+            profiler = SamplingProfiler().start()
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            _current_request.reset(token)
+            # 路由匹配后 scope 里会有 route，用路由模板（/tasks/{task_id}）而不是实际路径做标签
+            route = getattr(scope.get("route"), "path", UNMATCHED_ROUTE)
+            method = scope["method"]
+            HTTP_REQUESTS.inc(method, route, status_code)
+            HTTP_REQUEST_SECONDS.observe(elapsed, method, route)
+            HTTP_REQUEST_QUERIES.observe(stats.queries, method, route)
+            HTTP_REQUEST_DB_SECONDS.observe(stats.db_seconds, method, route)
+            if stats.queries > REQUEST_QUERY_BUDGET:
+                QUERY_BUDGET_EXCEEDED.inc(method, route)
+                logger.warning(
+                    "⚠️ %s %s 执行了 %d 条 SQL（预算 %d），SQL 耗时 %.1f ms / 总耗时 %.1f ms",
+                    method, scope.get("path", route), stats.queries, REQUEST_QUERY_BUDGET,
+                    stats.db_seconds * 1000, elapsed * 1000,
+                )
+            if profiler is not None:
+                profiler.stop()
+                _profiler_lock.release()
+                try:
+                    _save_profile(profiler, method, route, elapsed)
+                except OSError as e:
+                    logger.warning("⚠️ 保存采样结果失败: %s", e)
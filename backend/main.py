@@ -1,33 +1,128 @@
 # backend/main.py (终极修正版)
 import os
-from datetime import datetime, timedelta
-from typing import Union, List, Optional
+import io
+import re
+import time
+import csv
+import json
+import zlib
+import codecs
+import hmac
+import hashlib
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from dataclasses import dataclass
+from types import SimpleNamespace
+from collections import Counter
+from typing import Annotated, Union, List, Dict, Optional
+
+# orjson 是可选依赖，没装时任务列表退回标准 JSON 编码
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # 1. 引入 dotenv，确保能读取 .env 文件
 from dotenv import load_dotenv
 load_dotenv()
 
-from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File
+# 日志：ai_agent 和性能埋点都走 logging，级别用 LOG_LEVEL 调
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s [%(name)s] %(message)s",
+)
+# OpenAI 客户端底层的 httpx 每个请求都打一条 INFO，调用耗时已经记在指标里了
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logger = logging.getLogger("vibe")
+
+from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
 from fastapi.staticfiles import StaticFiles
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, ForeignKey, DateTime
+from sqlalchemy import create_engine, Column, Integer, String, Boolean, ForeignKey, DateTime, Text, Index, inspect, or_, and_, case, select, update, insert, delete, func, event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session, relationship
-from pydantic import BaseModel
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, field_validator
 from jose import JWTError, jwt
 
 # 导入 AI 函数
+import ai_agent
 from ai_agent import analyze_task_text
+# 任务全文检索索引
+import search
+# 任务变更推送
+from events import Broadcaster
+# 进程内 LRU/TTL 缓存
+from cache import TTLCache
+# 监控指标和请求级性能埋点
+import metrics
+import instrumentation
 
 # --- 配置区域 ---
 SECRET_KEY = os.getenv("SECRET_KEY", "vibe_coding_secret_key_123")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 300
+# 已验证用户缓存：条目数上限和最长存活秒数
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "300"))
+# 任务变更推送：每个连接最多积压多少条事件、多久发一次心跳
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "100"))
+EVENT_HEARTBEAT_SECONDS = float(os.getenv("EVENT_HEARTBEAT_SECONDS", "15"))
+# /metrics 的访问令牌，设置后抓取方需要带 "Authorization: Bearer <令牌>"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+# 头像大小上限；multipart 的边界、字段头等额外开销另外留 64KB
+AVATAR_MAX_BYTES = int(os.getenv("AVATAR_MAX_BYTES", str(5 * 1024 * 1024)))
+UPLOAD_FORM_OVERHEAD = 64 * 1024
 
 app = FastAPI()
 
+# --- 请求体大小限制 ---
+# 上传接口的 multipart 会在进入路由函数之前被整个解析、落盘，所以要在更外层把关：
+# Content-Length 超限直接 413，不读请求体；没有 Content-Length（分块传输）的边收边数，超限立即中止
+class BodySizeLimitMiddleware:
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            return await self.app(scope, receive, send)
+
+        detail = f"请求体不能超过 {limit // 1024 // 1024}MB"
+        content_length = Headers(scope=scope).get("content-length", "")
+        if content_length.isdigit() and int(content_length) > limit:
+            response = JSONResponse({"detail": detail}, status_code=413, headers={"Connection": "close"})
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # 解析请求体时抛出的 HTTPException 会被 FastAPI 原样转成响应
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+# 放在 CORS 里面，413 的响应也带上跨域头，前端才能读到错误信息
+app.add_middleware(BodySizeLimitMiddleware, limits={"/upload/avatar": AVATAR_MAX_BYTES + UPLOAD_FORM_OVERHEAD})
+
 # --- 允许跨域 (CORS) ---
 # 👇 修改这一段 CORS 配置
 app.add_middleware(
@@ -38,13 +133,45 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # 让前端能读到分页游标等自定义响应头
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
+# 请求耗时 / SQL 条数统计（最外层，CORS 的耗时也算在内）
+app.add_middleware(instrumentation.RequestMetricsMiddleware)
 
 # --- 静态文件服务 ---
+UPLOAD_DIR = "uploads"
+AVATAR_DIR = os.path.join(UPLOAD_DIR, "avatars")
+# 写了一半的临时文件放在 /uploads 挂载目录之外，免得被人直接下载；和 UPLOAD_DIR 同级，os.replace 仍是原子的
+UPLOAD_TMP_DIR = "uploads_tmp"
+# 头像文件名是内容的 sha256（缩略图再带上边长），内容变了 URL 就变，可以让浏览器永久缓存
+HASHED_UPLOAD_RE = re.compile(r"^([0-9a-f]{64})(?:_(\d+))?\.[0-9a-z]+$")
+
+class UploadsStaticFiles(StaticFiles):
+    async def get_response(self, path: str, scope):
+        match = HASHED_UPLOAD_RE.match(os.path.basename(path))
+        if match is None:
+            # 老的 avatar_{id} 文件名会被覆盖，每次都要回源校验
+            response = await super().get_response(path, scope)
+            response.headers["Cache-Control"] = "no-cache"
+            return response
+
+        # 内容寻址的文件：强 ETag 直接取自文件名，命中时不用碰磁盘
+        etag = f'"{match.group(1)}-{match.group(2)}"' if match.group(2) else f'"{match.group(1)}"'
+        cache_headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+        if_none_match = Headers(scope=scope).get("if-none-match", "")
+        if etag in [t.strip() for t in if_none_match.split(",")]:
+            return Response(status_code=304, headers=cache_headers)
+        response = await super().get_response(path, scope)
+        if response.status_code == 200:
+            response.headers.update(cache_headers)
+        return response
+
 # 创建uploads目录
-os.makedirs("uploads", exist_ok=True)
+os.makedirs(AVATAR_DIR, exist_ok=True)
+os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
 # 挂载静态文件服务
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+app.mount("/uploads", UploadsStaticFiles(directory=UPLOAD_DIR), name="uploads")
 
 # --- 数据库配置 ---
 # 优先从 .env 获取，如果没有则使用默认值
@@ -54,11 +181,79 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./vibe_tasks.db")
 if DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
+# libpq 的连接参数 asyncpg 大多不认识（会在连接时报 TypeError）：sslmode 换成 asyncpg 的 ssl，其余直接去掉，
+# 需要证书文件之类的配置时请单独设置 ASYNC_DATABASE_URL
+_ASYNCPG_DROPPED_ARGS = ("sslcert", "sslkey", "sslrootcert", "sslcrl", "sslpassword", "connect_timeout", "target_session_attrs", "options")
+
+# 异步引擎的地址：默认由 DATABASE_URL 换成对应的异步驱动（aiosqlite / asyncpg）
+def _async_database_url(url: str):
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    if url.startswith("postgresql:") or url.startswith("postgresql+psycopg2:"):
+        async_url = make_url(url).set(drivername="postgresql+asyncpg")
+        query = dict(async_url.query)
+        if "sslmode" in query:
+            query["ssl"] = query.pop("sslmode")
+        dropped = [name for name in _ASYNCPG_DROPPED_ARGS if query.pop(name, None) is not None]
+        if dropped:
+            logger.warning("⚠️ 异步数据库地址去掉了 asyncpg 不支持的参数: %s", ", ".join(dropped))
+        return async_url.set(query=query).render_as_string(hide_password=False)
+    return None
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_database_url(DATABASE_URL)
+
+# 连接池参数（SQLite 用默认池，只设置 pre-ping）
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+# SQLite：WAL 让读写互不阻塞，synchronous=NORMAL 在 WAL 下足够安全，busy_timeout 让写冲突时等待而不是直接报错
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+def _engine_options(url: str) -> dict:
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    if not url.startswith("sqlite"):
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+    return options
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
 # 创建引擎
-engine = create_engine(DATABASE_URL)
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
+if engine.dialect.name == "sqlite":
+    event.listen(engine, "connect", _apply_sqlite_pragmas)
+instrumentation.instrument_engine(engine, "sync")
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# 异步引擎：和同步引擎共用同一个数据库，接口可以一个个从 get_db 迁到 get_async_db。
+# 没装对应的异步驱动时为 None，已迁移的接口退回同步会话、在线程池里执行
+async_engine = None
+AsyncSessionLocal = None
+if ASYNC_DATABASE_URL:
+    try:
+        async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_options(ASYNC_DATABASE_URL))
+    except ImportError as e:
+        logger.warning("⚠️ 异步数据库驱动不可用，异步接口已停用: %s", e)
+    else:
+        if async_engine.dialect.name == "sqlite":
+            event.listen(async_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+        instrumentation.instrument_engine(async_engine.sync_engine, "async")
+        AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # --- 1. 数据库模型 (Models) ---
 class User(Base):
     __tablename__ = "users"
@@ -66,6 +261,8 @@ class User(Base):
     username = Column(String(50), unique=True, index=True)
     hashed_password = Column(String(100))
     avatar_url = Column(String(200), default="")
+    # 任务变更版本号：该用户的任务每提交一次写操作就 +1，用于增量同步和 ETag
+    change_version = Column(Integer, default=0)
     tasks = relationship("Task", back_populates="owner")
 
 class Task(Base):
@@ -77,12 +274,230 @@ class Task(Base):
     priority = Column(Integer, default=1)  # 1: 低, 2: 中, 3: 高
     deadline = Column(DateTime, nullable=True)
     sort_order = Column(Integer, default=0)  # 用于拖拽排序
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    version = Column(Integer, default=0)  # 最后一次修改时的 User.change_version
     owner_id = Column(Integer, ForeignKey("users.id"))
     owner = relationship("User", back_populates="tasks")
 
+    __table_args__ = (
+        # 列表分页：按 (sort_order, id) 做 keyset 游标，每页都是一次索引范围扫描
+        Index("ix_tasks_owner_sort", "owner_id", "sort_order", "id"),
+        # 截止日期窗口筛选（过期 / 今天 / 本周）
+        Index("ix_tasks_owner_deadline", "owner_id", "deadline"),
+        # 增量同步：取 version > since 的任务
+        Index("ix_tasks_owner_version", "owner_id", "version"),
+    )
+
+class TaskTombstone(Base):
+    # 已删除任务的墓碑记录，增量同步时告诉客户端哪些任务被删了
+    __tablename__ = "task_tombstones"
+    id = Column(Integer, primary_key=True)
+    task_id = Column(Integer, nullable=False)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    version = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_task_tombstones_owner_version", "owner_id", "version"),
+    )
+
+class AIAnalysisCache(Base):
+    # AI 分析结果的持久化缓存，键是 ai_agent.cache_key() 算出的哈希
+    __tablename__ = "ai_analysis_cache"
+    key = Column(String(64), primary_key=True)
+    result = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)  # 按天清理过期的行
+
+class TaskStat(Base):
+    # 每个用户的任务统计计数器，随任务的增删改在同一个事务里增量更新，
+    # 仪表盘读统计时只扫该用户的这几十行，不再随任务数增长
+    # dimension: status（done/pending）、category、priority、deadline（未完成任务按截止日 YYYY-MM-DD 计数）
+    __tablename__ = "task_stats"
+    owner_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    dimension = Column(String(20), primary_key=True)
+    bucket = Column(String(50), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
 # 创建表结构
 Base.metadata.create_all(bind=engine)
 
+def _upgrade_schema():
+    # create_all 不会改动已存在的表，这里给老数据库补上后来新增的列和索引
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing_columns = {c["name"] for c in inspector.get_columns(table.name)}
+        with engine.begin() as conn:
+            for column in table.columns:
+                if column.name not in existing_columns:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}')
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+_upgrade_schema()
+
+def _backfill_search_index():
+    # 检索索引第一次建立时，把已有任务补进去
+    if not search.ensure_index(engine):
+        return
+    db = SessionLocal()
+    try:
+        batch = []
+        for task in db.query(Task).order_by(Task.id).yield_per(1000):
+            batch.append(task)
+            if len(batch) >= 1000:
+                search.index_tasks(db, batch)
+                batch = []
+        search.index_tasks(db, batch)
+        db.commit()
+    finally:
+        db.close()
+
+_backfill_search_index()
+
+# --- 任务统计计数器 ---
+def task_stat_keys(task) -> list:
+    """一个任务计入哪些 (dimension, bucket)，task 可以是 ORM 对象或带同名属性的对象"""
+    keys = [
+        ("status", "done" if task.is_done else "pending"),
+        ("category", task.category or "其他"),
+        ("priority", str(task.priority or 1)),
+    ]
+    # 截止日期只统计未完成的任务，按天计数，读的时候再归到过期/今天/本周
+    if task.deadline is not None and not task.is_done:
+        keys.append(("deadline", task.deadline.date().isoformat()))
+    return keys
+
+def _upsert_task_stats(db: Session, rows: list):
+    dialect_name = db.get_bind().dialect.name
+    if dialect_name in ("sqlite", "postgresql"):
+        stmt = (sqlite_insert if dialect_name == "sqlite" else pg_insert)(TaskStat)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[TaskStat.owner_id, TaskStat.dimension, TaskStat.bucket],
+            set_={"count": TaskStat.count + stmt.excluded["count"]},
+        )
+        db.execute(stmt, rows)
+        return
+    # 其它数据库：先加，没有这一行再插入
+    for row in rows:
+        result = db.execute(
+            update(TaskStat)
+            .where(TaskStat.owner_id == row["owner_id"], TaskStat.dimension == row["dimension"], TaskStat.bucket == row["bucket"])
+            .values(count=TaskStat.count + row["count"])
+        )
+        if result.rowcount == 0:
+            db.execute(insert(TaskStat), [row])
+
+def apply_task_stats(db: Session, owner_id: int, added=(), removed=()):
+    """在当前事务里更新计数器，added/removed 是 task_stat_keys() 结果的列表"""
+    deltas = Counter()
+    for keys in added:
+        deltas.update(keys)
+    for keys in removed:
+        deltas.subtract(keys)
+    rows = [
+        {"owner_id": owner_id, "dimension": dimension, "bucket": bucket, "count": count}
+        for (dimension, bucket), count in deltas.items() if count
+    ]
+    if not rows:
+        return
+    _upsert_task_stats(db, rows)
+    if any(row["count"] < 0 for row in rows):
+        # 减到 0 的行删掉（比如过了期又完成的截止日），计数器表只保留有任务的桶
+        db.execute(delete(TaskStat).where(TaskStat.owner_id == owner_id, TaskStat.count <= 0))
+
+def rebuild_task_stats(db: Session, owner_id: Optional[int] = None) -> int:
+    """按 tasks 表重新计算计数器（全部用户或单个用户），返回统计的任务数"""
+    query = db.query(Task.owner_id, Task.is_done, Task.category, Task.priority, Task.deadline)
+    cleanup = delete(TaskStat)
+    if owner_id is not None:
+        query = query.filter(Task.owner_id == owner_id)
+        cleanup = cleanup.where(TaskStat.owner_id == owner_id)
+    counts = Counter()
+    total = 0
+    for row in query.yield_per(1000):
+        counts.update((row.owner_id, dimension, bucket) for dimension, bucket in task_stat_keys(row))
+        total += 1
+    db.execute(cleanup)
+    rows = [
+        {"owner_id": owner, "dimension": dimension, "bucket": bucket, "count": count}
+        for (owner, dimension, bucket), count in counts.items()
+    ]
+    for i in range(0, len(rows), 1000):
+        db.execute(insert(TaskStat), rows[i:i + 1000])
+    return total
+
+def _backfill_task_stats():
+    # 计数器表刚建出来（老数据库升级）时是空的，按已有任务补算一次
+    db = SessionLocal()
+    try:
+        if db.query(TaskStat.owner_id).first() is None and db.query(Task.id).first() is not None:
+            rebuild_task_stats(db)
+            db.commit()
+    finally:
+        db.close()
+
+_backfill_task_stats()
+
+def _repair_task_priorities():
+    # 早先的导入没有把优先级收到 1~3，仪表盘里会多出 "9" 这样的桶：把库里的值收回来，再按表重算计数器
+    db = SessionLocal()
+    try:
+        fixed = db.execute(update(Task).where(Task.priority < 1).values(priority=1)).rowcount
+        fixed += db.execute(update(Task).where(Task.priority > 3).values(priority=3)).rowcount
+        if fixed:
+            rebuild_task_stats(db)
+            logger.info("🔧 修正了 %d 个超出范围的任务优先级，已重算统计", fixed)
+        db.commit()
+    finally:
+        db.close()
+
+_repair_task_priorities()
+
+class SQLAnalysisStore:
+    # 给 ai_agent 用的持久化缓存，内存缓存没命中时再查这张表（多个 worker / 重启后都能复用）
+    def __init__(self):
+        self._pruned_on = None
+
+    def prune(self):
+        # 缓存键里带着当天日期（ai_agent.cache_key），今天之前写入的行不会再被命中，删掉
+        today = date.today()
+        # created_at 存的是 UTC，把本地今天零点换算成 UTC
+        cutoff = datetime.utcnow() - (datetime.now() - datetime.combine(today, datetime.min.time()))
+        db = SessionLocal()
+        try:
+            db.execute(delete(AIAnalysisCache).where(AIAnalysisCache.created_at < cutoff))
+            db.commit()
+        finally:
+            db.close()
+        self._pruned_on = today
+
+    def get(self, key: str):
+        db = SessionLocal()
+        try:
+            row = db.get(AIAnalysisCache, key)
+            return json.loads(row.result) if row else None
+        finally:
+            db.close()
+
+    def set(self, key: str, value: dict):
+        db = SessionLocal()
+        try:
+            db.merge(AIAnalysisCache(key=key, result=json.dumps(value, ensure_ascii=False)))
+            db.commit()
+        finally:
+            db.close()
+        # 进程一直不重启时，跨天后第一次写入顺便清理一次
+        if self._pruned_on != date.today():
+            self.prune()
+
+if os.getenv("AI_PERSISTENT_CACHE", "1") == "1":
+    analysis_store = SQLAnalysisStore()
+    analysis_store.prune()
+    ai_agent.set_persistent_store(analysis_store)
+
 # --- 2. 安全与工具 ---
 import bcrypt
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -104,30 +519,133 @@ def get_db():
     try: yield db
     finally: db.close()
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
+class ThreadpoolSession:
+    """没有异步驱动时 get_async_db 给出的替身：同步会话在线程池里执行，
+    提供已迁移接口用到的 AsyncSession 方法。结果在线程池里一次取完，回到事件循环后不再碰连接"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    async def execute(self, statement, *args, **kwargs):
+        frozen = await run_in_threadpool(lambda: self.db.execute(statement, *args, **kwargs).freeze())
+        return frozen()
+
+    async def scalars(self, statement, *args, **kwargs):
+        return (await self.execute(statement, *args, **kwargs)).scalars()
+
+    async def scalar(self, statement, *args, **kwargs):
+        return await run_in_threadpool(self.db.scalar, statement, *args, **kwargs)
+
+    async def commit(self):
+        await run_in_threadpool(self.db.commit)
+
+    async def rollback(self):
+        await run_in_threadpool(self.db.rollback)
+
+async def get_async_db():
+    if AsyncSessionLocal is None:
+        db = SessionLocal()
+        try:
+            yield ThreadpoolSession(db)
+        finally:
+            await run_in_threadpool(db.close)
+        return
+    async with AsyncSessionLocal() as db:
+        yield db
+
+@dataclass(frozen=True)
+class Principal:
+    """已验证的当前用户，只含接口常用的字段，可以跨请求缓存"""
+    id: int
+    username: str
+    avatar_url: str
+
+# 已验证的 token -> Principal。命中时不查 users 表、不占用数据库连接；
+# 条目最长活到 token 过期，头像等用户信息变更时主动失效
+principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def _load_principal(token: str):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
-        if username is None: raise credentials_exception
+        if username is None: raise _credentials_exception()
     except JWTError:
-        raise credentials_exception
-        
-    user = db.query(User).filter(User.username == username).first()
-    if user is None: raise credentials_exception
+        raise _credentials_exception()
+
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.username == username).first()
+    finally:
+        db.close()
+    if user is None: raise _credentials_exception()
+    principal = Principal(id=user.id, username=user.username, avatar_url=user.avatar_url)
+    principal_cache.set(token, principal, ttl=min(PRINCIPAL_CACHE_TTL, payload["exp"] - time.time()))
+    return principal
+
+async def get_current_principal(token: str = Depends(oauth2_scheme)) -> Principal:
+    principal = principal_cache.get(token)
+    if principal is None:
+        principal = await run_in_threadpool(_load_principal, token)
+    return principal
+
+async def get_current_user(principal: Principal = Depends(get_current_principal), db: Session = Depends(get_db)):
+    # 需要修改用户记录的接口才用这个，拿到的是绑定在本次会话上的 ORM 对象
+    user = db.get(User, principal.id)
+    if user is None: raise _credentials_exception()
     return user
 
+def invalidate_principal(user_id: int):
+    principal_cache.invalidate_where(lambda principal: principal.id == user_id)
+
+def bump_change_version(db: Session, owner_id: int) -> int:
+    # 在当前事务里把用户的变更版本号 +1 并返回新值，本次事务改动的任务都记这个版本
+    db.execute(
+        update(User)
+        .where(User.id == owner_id)
+        .values(change_version=func.coalesce(User.change_version, 0) + 1)
+        .execution_options(synchronize_session=False)
+    )
+    return db.query(User.change_version).filter(User.id == owner_id).scalar()
+
+def current_change_version(db: Session, owner_id: int) -> int:
+    return db.query(User.change_version).filter(User.id == owner_id).scalar() or 0
+
+# --- 任务变更推送 ---
+broadcaster = Broadcaster(max_queue=EVENT_QUEUE_SIZE)
+
+def publish_task_event(owner_id: int, event_type: str, version: int, **fields):
+    # 事务提交后再推送，事件只带版本号和 id，客户端据此调用 /tasks/changes 增量同步
+    broadcaster.publish(owner_id, {"type": event_type, "version": version, **fields})
+
+# --- 任务列表的快速序列化 ---
+# 列表接口直接取列元组拼成字典，再用 orjson 编码，跳过 ORM 对象构造和 jsonable_encoder 的逐字段遍历
+TASK_FIELDS = ("id", "content", "is_done", "category", "priority", "deadline", "sort_order", "updated_at", "version", "owner_id")
+TASK_COLUMNS = [getattr(Task, field) for field in TASK_FIELDS]
+
+def task_rows_to_dicts(rows):
+    return [dict(zip(TASK_FIELDS, row)) for row in rows]
+
+class FastJSONResponse(JSONResponse):
+    # 装了 orjson 用 orjson（原生支持 datetime），否则退回标准 JSON 编码
+    def render(self, content) -> bytes:
+        if orjson is None:
+            return super().render(jsonable_encoder(content))
+        return orjson.dumps(content)
+
 # --- 3. Pydantic 模型 ---
 class TaskCreate(BaseModel):
     content: str
     category: str = "日常"
     priority: int = 1  # 1: 低, 2: 中, 3: 高
     deadline: Optional[datetime] = None
-    sort_order: int = 0
+    sort_order: Optional[int] = None  # 不传时排到最后，并和前一个任务隔开 SORT_STEP
 
 class TaskUpdate(BaseModel):
     is_done: bool = None
@@ -136,14 +654,57 @@ class TaskUpdate(BaseModel):
     deadline: Optional[datetime] = None
     sort_order: int = None
 
+class TaskMove(BaseModel):
+    prev_id: Optional[int] = None  # 移动后排在它前面的任务
+    next_id: Optional[int] = None  # 移动后排在它后面的任务
+
 class TaskImport(BaseModel):
-    content: str
-    category: str = "日常"
+    # 长度和 Task 的列宽一致，超长的行在这里就被拒绝，不会到写库时才整批报错
+    content: str = Field(..., max_length=200)
+    category: str = Field("日常", max_length=50)
     priority: int = 1
     deadline: Optional[datetime] = None
     is_done: bool = False
-    sort_order: int = 0
+    sort_order: Optional[int] = None
+
+    @field_validator("priority")
+    @classmethod
+    def _clamp_priority(cls, value: int) -> int:
+        # 和新建任务一样收到 1~3，超出整数列范围的值也不会进库
+        return clamp_priority(value)
     
+# --- 响应模型 ---
+class TaskOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    id: int
+    content: Optional[str] = None
+    is_done: Optional[bool] = None
+    category: Optional[str] = None
+    priority: Optional[int] = None
+    deadline: Optional[datetime] = None
+    sort_order: Optional[int] = None
+    updated_at: Optional[datetime] = None
+    version: Optional[int] = None
+    owner_id: Optional[int] = None
+
+class TaskChanges(BaseModel):
+    version: int
+    tasks: List[TaskOut]
+    deleted: List[int]
+
+class TaskStats(BaseModel):
+    total: int
+    done: int
+    pending: int
+    by_category: Dict[str, int]
+    by_priority: Dict[str, int]
+    deadline: Dict[str, int]  # 未完成任务：overdue / today / week
+
+class UserOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    username: str
+    avatar_url: Optional[str] = None
+
 class UserCreate(BaseModel):
     username: str
     password: str
@@ -151,6 +712,14 @@ class UserCreate(BaseModel):
 class AIRequest(BaseModel):
     text: str
 
+class AIBatchRequest(BaseModel):
+    texts: List[Annotated[str, Field(max_length=ai_agent.AI_BATCH_MAX_TEXT_LENGTH)]] = Field(
+        ..., min_length=1, max_length=ai_agent.AI_BATCH_MAX_ITEMS
+    )
+    concurrency: Optional[int] = Field(None, ge=1, le=ai_agent.AI_MAX_CONCURRENCY)
+    pack_size: int = Field(1, ge=1, le=ai_agent.AI_BATCH_MAX_PACK)  # 每次上游请求合并几条
+    create_tasks: bool = False  # 分析完直接把结果批量创建成任务
+
 # --- 4. 接口 API ---
 
 @app.post("/register")
@@ -171,24 +740,229 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
     access_token = create_access_token(data={"sub": user.username})
     return {"access_token": access_token, "token_type": "bearer"}
 
-@app.get("/tasks/")
-def read_tasks(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    # 按sort_order排序返回任务
-    return db.query(Task).filter(Task.owner_id == current_user.id).order_by(Task.sort_order).all()
+# 截止日期窗口：返回 [start, end) 区间，None 表示该侧不限
+DEADLINE_WINDOWS = ("overdue", "today", "tomorrow", "week", "month")
+
+def deadline_window(name: str, now: datetime):
+    today = datetime(now.year, now.month, now.day)
+    if name == "overdue":
+        return None, now
+    if name == "today":
+        return today, today + timedelta(days=1)
+    if name == "tomorrow":
+        return today + timedelta(days=1), today + timedelta(days=2)
+    if name == "week":
+        return today, today + timedelta(days=7)
+    if name == "month":
+        return today, today + timedelta(days=30)
+    raise ValueError(name)
+
+def encode_task_cursor(task) -> str:
+    return f"{task.sort_order}:{task.id}"
+
+def decode_task_cursor(cursor: str):
+    try:
+        sort_order, task_id = cursor.split(":", 1)
+        return int(sort_order), int(task_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+
+@app.get("/tasks/", response_model=List[TaskOut])
+def read_tasks(
+    request: Request,
+    category: Optional[str] = None,
+    priority: Optional[int] = Query(None, ge=1, le=3),
+    is_done: Optional[bool] = None,
+    deadline: Optional[str] = Query(None, description="overdue / today / tomorrow / week / month"),
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    current_user: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_db),
+):
+    # 任务没变时直接返回 304，不查询也不序列化任务列表。
+    # 截止日期窗口依赖当前时间，同一个版本号下结果也会变，所以不走 ETag
+    headers = {}
+    if not deadline:
+        etag = f'W/"{current_user.id}-{current_change_version(db, current_user.id)}-{zlib.crc32(request.url.query.encode()):x}"'
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+            return Response(status_code=304, headers=headers)
+
+    # 所有条件都以 owner_id 开头，走 (owner_id, sort_order, id) / (owner_id, deadline) 复合索引。
+    # 只查需要的列，不构造 ORM 对象
+    query = db.query(*TASK_COLUMNS).filter(Task.owner_id == current_user.id)
+
+    if category:
+        # 与前端一致：精确匹配或包含匹配（如 "购物" 能匹配 "🛒 购物"）
+        query = query.filter(Task.category.contains(category))
+    if priority is not None:
+        query = query.filter(Task.priority == priority)
+    if is_done is not None:
+        query = query.filter(Task.is_done == is_done)
+    if deadline:
+        if deadline not in DEADLINE_WINDOWS:
+            raise HTTPException(status_code=400, detail=f"deadline 只支持: {', '.join(DEADLINE_WINDOWS)}")
+        start, end = deadline_window(deadline, datetime.utcnow())
+        query = query.filter(Task.deadline.isnot(None))
+        if start is not None:
+            query = query.filter(Task.deadline >= start)
+        if end is not None:
+            query = query.filter(Task.deadline < end)
+        if deadline == "overdue":
+            query = query.filter(Task.is_done == False)
+
+    if cursor:
+        last_sort_order, last_id = decode_task_cursor(cursor)
+        query = query.filter(or_(
+            Task.sort_order > last_sort_order,
+            and_(Task.sort_order == last_sort_order, Task.id > last_id),
+        ))
+
+    # 按 (sort_order, id) 排序，id 兜底保证游标翻页稳定
+    query = query.order_by(Task.sort_order, Task.id)
+    if limit is None:
+        # 不传 limit 时保持原来的行为：一次返回全部（筛选后的）任务
+        return FastJSONResponse(task_rows_to_dicts(query.all()), headers=headers)
+
+    # 多取一条判断是否还有下一页，下一页游标放在响应头里，响应体仍然是任务数组
+    rows = query.limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = encode_task_cursor(rows[-1])
+    return FastJSONResponse(task_rows_to_dicts(rows), headers=headers)
 
-@app.post("/tasks/")
-def create_task(task: TaskCreate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+# 任务变更事件流 (Server-Sent Events)。EventSource 不能带请求头，所以 token 走查询参数
+def _read_change_version(owner_id: int) -> int:
+    db = SessionLocal()
+    try:
+        return current_change_version(db, owner_id)
+    finally:
+        db.close()
+
+@app.get("/tasks/events")
+async def task_events(request: Request, token: Optional[str] = None):
+    if not token:
+        token = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+    # 只在建立连接时查一次，不让长连接一直占着数据库连接；
+    # 取连接可能要排队等连接池，放到线程池里，不阻塞事件循环上的其它连接
+    user_id = (await get_current_principal(token)).id
+    version = await run_in_threadpool(_read_change_version, user_id)
+
+    async def event_stream():
+        async with broadcaster.subscribe(user_id) as subscription:
+            yield f"retry: 3000\ndata: {json.dumps({'type': 'ready', 'version': version})}\n\n"
+            while not await request.is_disconnected():
+                message = await subscription.get(timeout=EVENT_HEARTBEAT_SECONDS)
+                # 没有事件时发注释行当心跳，避免代理把空闲连接断掉
+                yield ": ping\n\n" if message is None else f"data: {message}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# 增量同步：返回版本号 since 之后新增/修改的任务和被删除的任务 id
+# 每次写操作后前端都会调这个接口，已迁到异步数据库会话，不占用线程池（没有异步驱动时退回线程池里的同步会话）
+@app.get("/tasks/changes", response_model=TaskChanges)
+async def read_task_changes(
+    since: int = Query(0, ge=0),
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db),
+):
+    version = await db.scalar(select(User.change_version).where(User.id == current_user.id)) or 0
+    query = select(*TASK_COLUMNS).where(Task.owner_id == current_user.id)
+    if since > 0:
+        query = query.where(Task.version > since)
+    changed = task_rows_to_dicts((await db.execute(query.order_by(Task.sort_order, Task.id))).all())
+    deleted = []
+    if since > 0:
+        deleted = (await db.scalars(
+            select(TaskTombstone.task_id)
+            .where(TaskTombstone.owner_id == current_user.id, TaskTombstone.version > since)
+        )).all()
+    return FastJSONResponse({"version": version, "tasks": changed, "deleted": list(deleted)})
+
+# 全文检索：按相关度排序分页返回，中文按单字/双字切词
+@app.get("/tasks/search", response_model=List[TaskOut])
+def search_tasks(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    current_user: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_db),
+):
+    task_ids = search.search_task_ids(db, current_user.id, q, limit, offset)
+    if task_ids is None:
+        # 数据库不支持全文索引，或者查询里全是标点，退回子串匹配
+        pattern = f"%{q.strip()}%"
+        return (
+            db.query(Task)
+            .filter(Task.owner_id == current_user.id)
+            .filter(or_(Task.content.ilike(pattern), Task.category.ilike(pattern)))
+            .order_by(Task.sort_order, Task.id)
+            .offset(offset).limit(limit).all()
+        )
+    if not task_ids:
+        return []
+    # 按索引给出的相关度顺序返回
+    tasks = {task.id: task for task in db.query(Task).filter(Task.owner_id == current_user.id, Task.id.in_(task_ids))}
+    return [tasks[task_id] for task_id in task_ids if task_id in tasks]
+
+# 仪表盘统计：直接读计数器表，和任务总数无关
+@app.get("/tasks/stats", response_model=TaskStats)
+def read_task_stats(current_user: Principal = Depends(get_current_principal), db: Session = Depends(get_db)):
+    rows = db.query(TaskStat.dimension, TaskStat.bucket, TaskStat.count).filter(
+        TaskStat.owner_id == current_user.id, TaskStat.count > 0
+    )
+    stats = {"status": {}, "category": {}, "priority": {}, "deadline": {}}
+    for row in rows:
+        stats.setdefault(row.dimension, {})[row.bucket] = row.count
+
+    # 截止日期按天计数，这里按天粒度归桶：今天之前算过期，本周是今天起 7 天内（含今天）
+    today = datetime.utcnow().date()
+    today_key = today.isoformat()
+    week_end_key = (today + timedelta(days=7)).isoformat()
+    deadline = {"overdue": 0, "today": 0, "week": 0}
+    for day, count in stats["deadline"].items():
+        if day < today_key:
+            deadline["overdue"] += count
+        elif day < week_end_key:
+            deadline["week"] += count
+            if day == today_key:
+                deadline["today"] += count
+
+    done = stats["status"].get("done", 0)
+    pending = stats["status"].get("pending", 0)
+    return {
+        "total": done + pending,
+        "done": done,
+        "pending": pending,
+        "by_category": stats["category"],
+        "by_priority": stats["priority"],
+        "deadline": deadline,
+    }
+
+def guess_category(content: str) -> str:
+    if "买" in content or "购" in content: return "🛒 购物"
+    if "学" in content or "码" in content: return "💻 学习"
+    return "日常"
+
+def clamp_priority(priority) -> int:
+    try:
+        priority = int(priority)
+    except (TypeError, ValueError):
+        return 1
+    return min(max(priority, 1), 3)
+
+@app.post("/tasks/", response_model=TaskOut)
+def create_task(task: TaskCreate, current_user: Principal = Depends(get_current_principal), db: Session = Depends(get_db)):
     # 自动分类逻辑
-    category = task.category
-    if not category:
-        category = "日常"
-        if "买" in task.content or "购" in task.content: category = "🛒 购物"
-        elif "学" in task.content or "码" in task.content: category = "💻 学习"
+    category = task.category or guess_category(task.content)
     
     # 确保优先级在有效范围内
-    priority = task.priority
-    if priority < 1: priority = 1
-    if priority > 3: priority = 3
+    priority = clamp_priority(task.priority)
     
     db_task = Task(
         content=task.content, 
@@ -196,18 +970,140 @@ def create_task(task: TaskCreate, current_user: User = Depends(get_current_user)
         category=category, 
         priority=priority,
         deadline=task.deadline,
-        sort_order=task.sort_order,
+        sort_order=task.sort_order if task.sort_order is not None else next_sort_order(db, current_user.id),
+        version=bump_change_version(db, current_user.id),
         owner_id=current_user.id
     )
     db.add(db_task)
+    db.flush()
+    search.index_tasks(db, [db_task])
+    apply_task_stats(db, current_user.id, added=[task_stat_keys(db_task)])
     db.commit()
     db.refresh(db_task)
+    publish_task_event(current_user.id, "created", db_task.version, ids=[db_task.id])
     return db_task
 
-@app.put("/tasks/{task_id}")
-def update_task(task_id: int, task_update: TaskUpdate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+# --- 任务排序 ---
+# sort_order 之间留出间隔，拖拽一个任务时取前后两个邻居的中间值，只改这一行；
+# 间隔用完（相邻两个值挨在一起）时才对该用户的任务整体重新编号一次
+SORT_STEP = 1024
+SORT_BATCH_SIZE = 500
+
+def next_sort_order(db: Session, owner_id: int) -> int:
+    # 新任务排在最后：当前最大值再加一个间隔（走 (owner_id, sort_order, id) 索引，只读一行）
+    last = db.query(func.max(Task.sort_order)).filter(Task.owner_id == owner_id).scalar()
+    return (last or 0) + SORT_STEP
+
+def _rebalance_sort_order(db: Session, owner_id: int, version: int):
+    task_ids = [row.id for row in db.query(Task.id).filter(Task.owner_id == owner_id).order_by(Task.sort_order, Task.id)]
+    if task_ids:
+        db.execute(update(Task), [
+            {"id": task_id, "sort_order": (i + 1) * SORT_STEP, "version": version}
+            for i, task_id in enumerate(task_ids)
+        ])
+
+def _sort_key_after(db: Session, owner_id: int, task: Task, exclude_id: int):
+    # 紧跟在 task 后面的那个任务（不含正在移动的任务）
+    return db.query(Task).filter(
+        Task.owner_id == owner_id, Task.id != exclude_id,
+        or_(Task.sort_order > task.sort_order, and_(Task.sort_order == task.sort_order, Task.id > task.id)),
+    ).order_by(Task.sort_order, Task.id).first()
+
+def _sort_key_before(db: Session, owner_id: int, task: Task, exclude_id: int):
+    # 紧挨在 task 前面的那个任务（不含正在移动的任务）
+    return db.query(Task).filter(
+        Task.owner_id == owner_id, Task.id != exclude_id,
+        or_(Task.sort_order < task.sort_order, and_(Task.sort_order == task.sort_order, Task.id < task.id)),
+    ).order_by(Task.sort_order.desc(), Task.id.desc()).first()
+
+def _sort_order_between(prev_task: Optional[Task], next_task: Optional[Task]):
+    # 返回 None 表示两个邻居之间已经没有空位，需要重新编号
+    if prev_task is None:
+        return next_task.sort_order - SORT_STEP
+    if next_task is None:
+        return prev_task.sort_order + SORT_STEP
+    if next_task.sort_order - prev_task.sort_order < 2:
+        return None
+    return (prev_task.sort_order + next_task.sort_order) // 2
+
+# 批量更新任务排序的端点（需要定义在 /tasks/{task_id} 之前，否则 "sort" 会被当成 task_id）
+@app.put("/tasks/sort")
+def update_tasks_sort(tasks: list[dict], current_user: Principal = Depends(get_current_principal), db: Session = Depends(get_db)):
+    try:
+        orders = {}
+        for task_data in tasks:
+            task_id = task_data.get("id")
+            sort_order = task_data.get("sort_order")
+            if task_id and sort_order is not None:
+                orders[int(task_id)] = int(sort_order)
+        # 一条 UPDATE ... SET sort_order = CASE id WHEN ... END WHERE owner_id = ? AND id IN (...)，
+        # 列表很长时按批拆开，避免超出数据库的参数个数上限
+        items = list(orders.items())
+        version = bump_change_version(db, current_user.id) if items else None
+        for i in range(0, len(items), SORT_BATCH_SIZE):
+            batch = dict(items[i:i + SORT_BATCH_SIZE])
+            db.execute(
+                update(Task)
+                .where(Task.owner_id == current_user.id, Task.id.in_(batch.keys()))
+                .values(sort_order=case(batch, value=Task.id), version=version)
+                .execution_options(synchronize_session=False)
+            )
+        db.commit()
+        if version is not None:
+            publish_task_event(current_user.id, "reordered", version, count=len(items))
+        return {"status": "success", "message": "任务排序已更新"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"更新任务排序失败: {str(e)}")
+
+# 拖拽单个任务：传入目标位置前后的邻居，只更新被拖动的这一行
+@app.put("/tasks/{task_id}/move", response_model=TaskOut)
+def move_task(task_id: int, move: TaskMove, current_user: Principal = Depends(get_current_principal), db: Session = Depends(get_db)):
     db_task = db.query(Task).filter(Task.id == task_id, Task.owner_id == current_user.id).first()
     if not db_task: raise HTTPException(status_code=404, detail="任务找不到或无权修改")
+    if move.prev_id is None and move.next_id is None:
+        raise HTTPException(status_code=400, detail="prev_id 和 next_id 至少提供一个")
+    if task_id in (move.prev_id, move.next_id):
+        raise HTTPException(status_code=400, detail="邻居不能是任务自己")
+
+    def load_neighbors():
+        prev_task = next_task = None
+        if move.prev_id is not None:
+            prev_task = db.query(Task).filter(Task.id == move.prev_id, Task.owner_id == current_user.id).first()
+            if not prev_task: raise HTTPException(status_code=404, detail="prev_id 对应的任务不存在")
+        if move.next_id is not None:
+            next_task = db.query(Task).filter(Task.id == move.next_id, Task.owner_id == current_user.id).first()
+            if not next_task: raise HTTPException(status_code=404, detail="next_id 对应的任务不存在")
+        # 只给了一个邻居时，另一侧取它在全局顺序里的真实邻居
+        if prev_task is not None and next_task is None:
+            next_task = _sort_key_after(db, current_user.id, prev_task, task_id)
+        elif next_task is not None and prev_task is None:
+            prev_task = _sort_key_before(db, current_user.id, next_task, task_id)
+        if prev_task is not None and next_task is not None and \
+                (prev_task.sort_order, prev_task.id) >= (next_task.sort_order, next_task.id):
+            raise HTTPException(status_code=400, detail="prev_id 必须排在 next_id 前面")
+        return prev_task, next_task
+
+    prev_task, next_task = load_neighbors()
+    version = bump_change_version(db, current_user.id)
+    new_sort_order = _sort_order_between(prev_task, next_task)
+    if new_sort_order is None:
+        _rebalance_sort_order(db, current_user.id, version)
+        db.expire_all()
+        prev_task, next_task = load_neighbors()
+        new_sort_order = _sort_order_between(prev_task, next_task)
+
+    db_task.sort_order = new_sort_order
+    db_task.version = version
+    db.commit()
+    db.refresh(db_task)
+    publish_task_event(current_user.id, "moved", version, ids=[db_task.id])
+    return db_task
+
+@app.put("/tasks/{task_id}", response_model=TaskOut)
+def update_task(task_id: int, task_update: TaskUpdate, current_user: Principal = Depends(get_current_principal), db: Session = Depends(get_db)):
+    db_task = db.query(Task).filter(Task.id == task_id, Task.owner_id == current_user.id).first()
+    if not db_task: raise HTTPException(status_code=404, detail="任务找不到或无权修改")
+    old_stat_keys = task_stat_keys(db_task)
     
     # 只更新提供的字段
     if task_update.is_done is not None:
@@ -216,107 +1112,371 @@ def update_task(task_id: int, task_update: TaskUpdate, current_user: User = Depe
         db_task.content = task_update.content
     if task_update.priority is not None:
         # 确保优先级在有效范围内
-        priority = task_update.priority
-        if priority < 1: priority = 1
-        if priority > 3: priority = 3
-        db_task.priority = priority
+        db_task.priority = clamp_priority(task_update.priority)
     if task_update.deadline is not None:
         db_task.deadline = task_update.deadline
     if task_update.sort_order is not None:
         db_task.sort_order = task_update.sort_order
     
+    if task_update.content is not None:
+        search.index_tasks(db, [db_task])
+    apply_task_stats(db, current_user.id, added=[task_stat_keys(db_task)], removed=[old_stat_keys])
+    db_task.version = bump_change_version(db, current_user.id)
     db.commit()
+    publish_task_event(current_user.id, "updated", db_task.version, ids=[db_task.id])
     return db_task
 
-# 批量更新任务排序的端点
-@app.put("/tasks/sort")
-def update_tasks_sort(tasks: list[dict], current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    try:
-        for task_data in tasks:
-            task_id = task_data.get("id")
-            sort_order = task_data.get("sort_order")
-            if task_id and sort_order is not None:
-                db_task = db.query(Task).filter(Task.id == task_id, Task.owner_id == current_user.id).first()
-                if db_task:
-                    db_task.sort_order = sort_order
-        db.commit()
-        return {"status": "success", "message": "任务排序已更新"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"更新任务排序失败: {str(e)}")
-
 @app.delete("/tasks/{task_id}")
-def delete_task(task_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def delete_task(task_id: int, current_user: Principal = Depends(get_current_principal), db: Session = Depends(get_db)):
     db_task = db.query(Task).filter(Task.id == task_id, Task.owner_id == current_user.id).first()
     if not db_task: raise HTTPException(status_code=404, detail="任务找不到或无权删除")
+    search.remove_tasks(db, [db_task.id])
+    apply_task_stats(db, current_user.id, removed=[task_stat_keys(db_task)])
+    version = bump_change_version(db, current_user.id)
+    db.add(TaskTombstone(task_id=task_id, owner_id=current_user.id, version=version))
     db.delete(db_task)
     db.commit()
+    publish_task_event(current_user.id, "deleted", version, ids=[task_id])
     return {"msg": "删除成功"}
 
 # --- 任务导出/导入 --- 
+# 导出：单独开一个会话，按 EXPORT_BATCH_SIZE 分批从游标里取列（不构造 ORM 对象），边查边写出
+# 导入：请求体边读边解析，每攒够 IMPORT_CHUNK_SIZE 条就用一条 executemany INSERT 写入并提交，
+#      内存占用只和单批大小有关，与文件大小无关
+EXPORT_BATCH_SIZE = 1000
+IMPORT_CHUNK_SIZE = 500
+IMPORT_MAX_LINE_BYTES = 64 * 1024
+IMPORT_MAX_ERRORS = 20
+TASK_EXPORT_FIELDS = ("content", "category", "priority", "deadline", "is_done", "sort_order")
+
+def _iter_export_rows(owner_id: int):
+    db = SessionLocal()
+    try:
+        query = (
+            db.query(*[getattr(Task, field) for field in TASK_EXPORT_FIELDS])
+            .filter(Task.owner_id == owner_id)
+            .order_by(Task.sort_order, Task.id)
+            .yield_per(EXPORT_BATCH_SIZE)
+        )
+        for row in query:
+            item = dict(zip(TASK_EXPORT_FIELDS, row))
+            if item["deadline"] is not None:
+                item["deadline"] = item["deadline"].isoformat()
+            yield item
+    finally:
+        db.close()
+
+def _export_json(owner_id: int):
+    # 与原来的返回结构一致：{"tasks": [...], "export_time": ...}
+    yield '{"tasks": ['
+    first = True
+    for item in _iter_export_rows(owner_id):
+        yield ("" if first else ",") + json.dumps(item, ensure_ascii=False)
+        first = False
+    yield f'], "export_time": {json.dumps(datetime.utcnow().isoformat())}}}'
+
+def _export_ndjson(owner_id: int):
+    for item in _iter_export_rows(owner_id):
+        yield json.dumps(item, ensure_ascii=False) + "\n"
+
+def _export_csv(owner_id: int):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(TASK_EXPORT_FIELDS)
+    for i, item in enumerate(_iter_export_rows(owner_id), 1):
+        writer.writerow(["" if item[field] is None else item[field] for field in TASK_EXPORT_FIELDS])
+        if i % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+EXPORT_FORMATS = {
+    "json": (_export_json, "application/json"),
+    "ndjson": (_export_ndjson, "application/x-ndjson"),
+    "csv": (_export_csv, "text/csv; charset=utf-8"),
+}
 
 # 导出任务
 @app.get("/tasks/export")
-def export_tasks(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    tasks = db.query(Task).filter(Task.owner_id == current_user.id).order_by(Task.sort_order).all()
-    # 转换为可序列化的格式
-    export_data = []
-    for task in tasks:
-        export_data.append({
-            "content": task.content,
-            "category": task.category,
-            "priority": task.priority,
-            "deadline": task.deadline,
-            "is_done": task.is_done,
-            "sort_order": task.sort_order
-        })
-    return {"tasks": export_data, "export_time": datetime.utcnow()}
+def export_tasks(format: str = Query("json", pattern="^(json|ndjson|csv)$"), current_user: Principal = Depends(get_current_principal)):
+    generator, media_type = EXPORT_FORMATS[format]
+    filename = f"vibe-tasks-export-{datetime.utcnow():%Y-%m-%d}.{format}"
+    return StreamingResponse(
+        generator(current_user.id),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+def bulk_insert_tasks(db: Session, owner_id: int, rows: list, version: int) -> list:
+    """在当前事务里批量插入任务（rows 是 TASK_EXPORT_FIELDS 字段的字典），返回新任务 id"""
+    task_ids = []
+    is_sqlite = db.get_bind().dialect.name == "sqlite"
+    # 没给 sort_order 的行依次排到最后，彼此间隔 SORT_STEP，之后拖拽不用整体重新编号
+    if any(row.get("sort_order") is None for row in rows):
+        next_key = next_sort_order(db, owner_id)
+        spaced = []
+        for row in rows:
+            if row.get("sort_order") is None:
+                row = {**row, "sort_order": next_key}
+                next_key += SORT_STEP
+            spaced.append(row)
+        rows = spaced
+    for i in range(0, len(rows), IMPORT_CHUNK_SIZE):
+        # 优先级和新建任务一样收到 1~3，统计里只会出现这三个桶
+        chunk = [
+            {**row, "priority": clamp_priority(row.get("priority", 1)), "owner_id": owner_id, "version": version}
+            for row in rows[i:i + IMPORT_CHUNK_SIZE]
+        ]
+        if is_sqlite:
+            # SQLite 上 RETURNING + sort_by_parameter_order 会退化成一行一条 INSERT，
+            # 所以直接 executemany，再按 (owner_id, version) 取回刚插入的 id：
+            # 写事务持有库锁，新 id 是连续递增的，最大的 len(chunk) 个就是这一批（按插入顺序）
+            db.execute(insert(Task), chunk)
+            chunk_ids = sorted(db.scalars(
+                select(Task.id).where(Task.owner_id == owner_id, Task.version == version)
+                .order_by(Task.id.desc()).limit(len(chunk))
+            ))
+        else:
+            # 其它数据库：一条 INSERT 批量写入，RETURNING 按参数顺序拿回 id 给检索索引用
+            chunk_ids = list(db.scalars(insert(Task).returning(Task.id, sort_by_parameter_order=True), chunk))
+        search.index_tasks(db, [
+            SimpleNamespace(id=task_id, owner_id=owner_id, content=row["content"], category=row["category"])
+            for task_id, row in zip(chunk_ids, chunk)
+        ])
+        apply_task_stats(db, owner_id, added=[task_stat_keys(SimpleNamespace(**row)) for row in chunk])
+        task_ids.extend(chunk_ids)
+    return task_ids
 
 # 导入任务
 @app.post("/tasks/import")
-def import_tasks(tasks: list[TaskImport], current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def import_tasks(tasks: list[TaskImport], current_user: Principal = Depends(get_current_principal), db: Session = Depends(get_db)):
     try:
         # 批量创建任务
-        for task_data in tasks:
-            db_task = Task(
-                content=task_data.content,
-                category=task_data.category,
-                priority=task_data.priority,
-                deadline=task_data.deadline,
-                is_done=task_data.is_done,
-                sort_order=task_data.sort_order,
-                owner_id=current_user.id
-            )
-            db.add(db_task)
+        version = bump_change_version(db, current_user.id)
+        task_ids = bulk_insert_tasks(db, current_user.id, [task_data.model_dump() for task_data in tasks], version)
         db.commit()
+        publish_task_event(current_user.id, "imported", version, count=len(task_ids))
         return {"status": "success", "message": f"成功导入 {len(tasks)} 个任务"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"导入任务失败: {str(e)}")
 
+async def _iter_body_lines(chunks):
+    # 按原始字节切行（UTF-8 的多字节字符里不会出现 \n），单行超过 IMPORT_MAX_LINE_BYTES 字节直接拒绝，
+    # 避免整个文件堆在内存里；每行切出来以后再解码
+    pending = b""
+    at_start = True
+    async for chunk in chunks:
+        pending += chunk
+        if at_start:
+            if len(pending) < len(codecs.BOM_UTF8) and codecs.BOM_UTF8.startswith(pending):
+                continue
+            if pending.startswith(codecs.BOM_UTF8):
+                pending = pending[len(codecs.BOM_UTF8):]
+            at_start = False
+        *lines, pending = pending.split(b"\n")
+        if len(pending) > IMPORT_MAX_LINE_BYTES or any(len(line) > IMPORT_MAX_LINE_BYTES for line in lines):
+            raise HTTPException(status_code=400, detail=f"单行超过 {IMPORT_MAX_LINE_BYTES} 字节")
+        for line in lines:
+            yield _decode_body_line(line)
+    if pending:
+        yield _decode_body_line(pending)
+
+def _decode_body_line(line: bytes) -> str:
+    try:
+        return line.decode("utf-8")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="请求体不是合法的 UTF-8 文本")
+
+async def _iter_import_records(chunks, format: str):
+    """逐条产出 (行号, 字典或错误信息)"""
+    if format == "ndjson":
+        line_no = 0
+        async for line in _iter_body_lines(chunks):
+            line_no += 1
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_no, f"JSON 解析失败: {e}"
+                continue
+            yield line_no, record if isinstance(record, dict) else "每行必须是一个 JSON 对象"
+        return
+
+    # CSV：引号里可以有换行，引号成对时才算一条完整记录
+    header = None
+    record, record_line = "", 0
+    line_no = 0
+    async for line in _iter_body_lines(chunks):
+        line_no += 1
+        record = f"{record}\n{line}" if record else line
+        record_line = record_line or line_no
+        if record.count('"') % 2:
+            if len(record.encode("utf-8")) > IMPORT_MAX_LINE_BYTES:
+                raise HTTPException(status_code=400, detail=f"单条记录超过 {IMPORT_MAX_LINE_BYTES} 字节")
+            continue
+        values = next(csv.reader([record]), [])
+        current_line, record, record_line = record_line, "", 0
+        if not any(value.strip() for value in values):
+            continue
+        if header is None:
+            header = [value.strip() for value in values]
+            continue
+        # 空单元格按未填写处理，走 TaskImport 的默认值
+        yield current_line, {key: value for key, value in zip(header, values) if value != ""}
+    # 请求体结束时引号还没闭合：后面吞进去的行都算这一条，记为拒绝，不能悄悄丢掉
+    if record:
+        yield record_line, "引号未闭合"
+
+class _ChunkedImporter:
+    """攒够一批就写库提交一次，并通过事件流推送进度"""
+
+    def __init__(self, db: Session, owner_id: int):
+        self.db = db
+        self.owner_id = owner_id
+        self.pending = []
+        self.accepted = 0
+        self.rejected = 0
+        self.errors = []
+
+    def add(self, line_no: int, record):
+        if isinstance(record, str):
+            return self.reject(line_no, record)
+        try:
+            task_data = TaskImport(**record)
+        except ValidationError as e:
+            error = e.errors()[0]
+            return self.reject(line_no, f"{'.'.join(map(str, error['loc']))}: {error['msg']}")
+        self.pending.append(task_data.model_dump())
+
+    def reject(self, line_no: int, reason: str):
+        self.rejected += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({"line": line_no, "error": reason})
+
+    def flush(self):
+        if not self.pending:
+            return
+        version = bump_change_version(self.db, self.owner_id)
+        task_ids = bulk_insert_tasks(self.db, self.owner_id, self.pending, version)
+        self.db.commit()
+        self.pending = []
+        self.accepted += len(task_ids)
+        publish_task_event(
+            self.owner_id, "import_progress", version,
+            accepted=self.accepted, rejected=self.rejected,
+        )
+
+# 流式导入：请求体是 NDJSON（每行一个任务）或带表头的 CSV，字段同导出
+@app.post("/tasks/import/stream")
+async def import_tasks_stream(
+    request: Request,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    current_user: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_db),
+):
+    importer = _ChunkedImporter(db, current_user.id)
+    try:
+        async for line_no, record in _iter_import_records(request.stream(), format):
+            importer.add(line_no, record)
+            if len(importer.pending) >= IMPORT_CHUNK_SIZE:
+                await run_in_threadpool(importer.flush)
+        await run_in_threadpool(importer.flush)
+    except HTTPException as e:
+        # 已提交的批次保留，把已导入的数量一并告诉客户端
+        raise HTTPException(status_code=e.status_code, detail=f"{e.detail}（已导入 {importer.accepted} 个任务）")
+    return {
+        "status": "success",
+        "accepted": importer.accepted,
+        "rejected": importer.rejected,
+        "errors": importer.errors,
+        "message": f"成功导入 {importer.accepted} 个任务，跳过 {importer.rejected} 条",
+    }
+
 # --- 文件上传：头像上传 --- 
-@app.post("/upload/avatar")
-def upload_avatar(file: UploadFile = File(...), current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    # 检查文件类型
-    if not file.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="只能上传图片文件")
-    
-    # 生成文件名
-    filename = f"avatar_{current_user.id}{os.path.splitext(file.filename)[1]}"
-    file_path = os.path.join("uploads", filename)
+# 请求体总大小先由 BodySizeLimitMiddleware 把关；上传内容按块读出，边算 sha256 边写临时文件，单个文件超过上限立即中止；
+# 以哈希命名，相同图片只存一份。缩略图放到后台线程池里生成，不占用请求时间
+AVATAR_CHUNK_SIZE = 64 * 1024
+AVATAR_VARIANT_SIZES = (64, 256)
+AVATAR_EXTENSIONS = {"image/png": ".png", "image/jpeg": ".jpg", "image/gif": ".gif", "image/webp": ".webp"}
+avatar_executor = ThreadPoolExecutor(max_workers=int(os.getenv("AVATAR_WORKERS", "2")), thread_name_prefix="avatar")
+
+def _store_avatar(source, ext: str):
+    """把上传内容写进 AVATAR_DIR，返回 (sha256, 文件名)"""
+    fd, tmp_path = tempfile.mkstemp(dir=UPLOAD_TMP_DIR, suffix=".part")
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while chunk := source.read(AVATAR_CHUNK_SIZE):
+                size += len(chunk)
+                if size > AVATAR_MAX_BYTES:
+                    raise HTTPException(status_code=413, detail=f"图片不能超过 {AVATAR_MAX_BYTES // 1024 // 1024}MB")
+                hasher.update(chunk)
+                out.write(chunk)
+        if size == 0:
+            raise HTTPException(status_code=400, detail="上传的文件是空的")
+        digest = hasher.hexdigest()
+        filename = f"{digest}{ext}"
+        path = os.path.join(AVATAR_DIR, filename)
+        if os.path.exists(path):
+            # 同样的图片已经有了，直接复用
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+        return digest, filename
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _generate_avatar_variants(filename: str, digest: str):
+    # 可选功能：装了 Pillow 才生成缩略图，文件名为 {sha256}_{边长}.webp
+    try:
+        from PIL import Image
+    except ImportError:
+        return
+    try:
+        with Image.open(os.path.join(AVATAR_DIR, filename)) as image:
+            image = image.convert("RGBA")
+            for size in AVATAR_VARIANT_SIZES:
+                path = os.path.join(AVATAR_DIR, f"{digest}_{size}.webp")
+                if os.path.exists(path):
+                    continue
+                variant = image.copy()
+                variant.thumbnail((size, size))
+                fd, tmp_path = tempfile.mkstemp(dir=UPLOAD_TMP_DIR, suffix=".part")
+                os.close(fd)
+                variant.save(tmp_path, "WEBP")
+                os.replace(tmp_path, path)
+    except Exception as e:
+        logger.warning("⚠️ 生成头像缩略图失败 %s: %s", filename, e)
+
+@app.post("/upload/avatar", response_model=UserOut)
+async def upload_avatar(file: UploadFile = File(...), current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    # 检查文件类型：扩展名只按白名单里的类型给，不用客户端的文件名（否则 x.html 会被当成网页托管出去）
+    ext = AVATAR_EXTENSIONS.get(file.content_type)
+    if ext is None:
+        raise HTTPException(status_code=400, detail="只能上传 PNG、JPEG、GIF 或 WebP 图片")
     
-    # 保存文件
-    with open(file_path, "wb") as f:
-        f.write(file.file.read())
+    # 分块写入磁盘（在线程池里做，不阻塞事件循环）
+    digest, filename = await run_in_threadpool(_store_avatar, file.file, ext)
     
     # 更新用户头像URL
-    current_user.avatar_url = f"/uploads/{filename}"
-    db.commit()
+    avatar_url = f"/uploads/avatars/{filename}"
+    user_id, username = current_user.id, current_user.username
+    current_user.avatar_url = avatar_url
+    await run_in_threadpool(db.commit)
+    invalidate_principal(user_id)
+    avatar_executor.submit(_generate_avatar_variants, filename, digest)
     
     # 返回更新后的用户信息
-    return {"avatar_url": current_user.avatar_url, "username": current_user.username}
+    return {"avatar_url": avatar_url, "username": username}
 
 # --- 获取当前用户信息 --- 
-@app.get("/users/me")
-def get_current_user_info(current_user: User = Depends(get_current_user)):
+@app.get("/users/me", response_model=UserOut)
+def get_current_user_info(current_user: Principal = Depends(get_current_principal)):
     return {"username": current_user.username, "avatar_url": current_user.avatar_url}
 
 @app.post("/ai/analyze")
@@ -330,4 +1490,90 @@ async def analyze_task(request: AIRequest):
     if not result:
         raise HTTPException(status_code=500, detail="AI analysis failed")
         
-    return result
\ No newline at end of file
+    return result
+
+def _task_row_from_analysis(text: str, result: dict):
+    # 把 AI 的分析结果转成 bulk_insert_tasks 需要的字段，识别失败的用原文兜底
+    title = (result or {}).get("title")
+    content = (title if title and title != "无法识别" else text).strip()[:200]
+    deadline = None
+    due_date = (result or {}).get("due_date")
+    if due_date:
+        try:
+            deadline = datetime.strptime(due_date, "%Y-%m-%d")
+        except (TypeError, ValueError):
+            deadline = None
+    return {
+        "content": content,
+        "category": guess_category(content),
+        "priority": clamp_priority((result or {}).get("priority", 1)),
+        "deadline": deadline,
+        "is_done": False,
+        "sort_order": None,
+    }
+
+def _create_tasks_from_rows(owner_id: int, rows: list):
+    db = SessionLocal()
+    try:
+        version = bump_change_version(db, owner_id)
+        task_ids = bulk_insert_tasks(db, owner_id, rows, version)
+        db.commit()
+    finally:
+        db.close()
+    publish_task_event(owner_id, "imported", version, count=len(task_ids))
+    return task_ids
+
+# 批量分析：多条文本并发分析，每条结果一出来就以 NDJSON 的一行推给客户端
+# 一次请求最多会打 AI_BATCH_MAX_ITEMS 次上游，所以和单条的 /ai/analyze 不同，必须登录
+@app.post("/ai/analyze/batch")
+async def analyze_tasks_batch(request: AIBatchRequest, current_user: Principal = Depends(get_current_principal)):
+    owner_id = current_user.id if request.create_tasks else None
+
+    async def result_stream():
+        results = {}
+        async for index, result in ai_agent.analyze_task_texts(request.texts, request.concurrency, request.pack_size):
+            results[index] = result
+            yield json.dumps({"index": index, "text": request.texts[index], "result": result}, ensure_ascii=False) + "\n"
+        if owner_id is not None:
+            # 全部分析完后一次批量插入，空行跳过
+            rows = [
+                _task_row_from_analysis(text, results.get(index))
+                for index, text in enumerate(request.texts) if text and text.strip()
+            ]
+            task_ids = await run_in_threadpool(_create_tasks_from_rows, owner_id, rows) if rows else []
+            yield json.dumps({"created": len(task_ids), "task_ids": task_ids}) + "\n"
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+# --- 监控指标 ---
+# 缓存命中率、SSE 连接数这类现成的状态，抓取时再读
+metrics.callback(
+    "cache_entries", "进程内缓存的条目数", "gauge", ["cache"],
+    lambda: [(("principal",), principal_cache.stats()["size"]), (("ai",), ai_agent.cache_stats()["size"])],
+)
+metrics.callback(
+    "cache_hits_total", "进程内缓存命中次数", "counter", ["cache"],
+    lambda: [(("principal",), principal_cache.hits), (("ai",), ai_agent.cache_stats()["hits"])],
+)
+metrics.callback(
+    "cache_misses_total", "进程内缓存未命中次数", "counter", ["cache"],
+    lambda: [(("principal",), principal_cache.misses), (("ai",), ai_agent.cache_stats()["misses"])],
+)
+metrics.callback(
+    "ai_inflight_requests", "正在等待上游结果的不同输入数", "gauge", (),
+    lambda: [((), ai_agent.cache_stats()["inflight"])],
+)
+if hasattr(broadcaster.backend, "subscriber_count"):
+    metrics.callback(
+        "sse_subscribers", "当前进程的任务事件（SSE）连接数", "gauge", (),
+        lambda: [((), broadcaster.backend.subscriber_count())],
+    )
+
+# Prometheus 文本格式
+@app.get("/metrics", include_in_schema=False)
+async def read_metrics(request: Request):
+    if METRICS_TOKEN:
+        authorization = request.headers.get("authorization", "")
+        if not hmac.compare_digest(authorization.encode(), f"Bearer {METRICS_TOKEN}".encode()):
+            raise HTTPException(status_code=401, detail="需要监控令牌")
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
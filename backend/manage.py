@@ -0,0 +1,43 @@
+# 文件路径: backend/manage.py
+# 运维命令，在 backend 目录下运行：
+#   python manage.py rebuild-stats              重新计算所有用户的任务统计计数器
+#   python manage.py rebuild-stats --user alice 只重算某个用户的
+
+import argparse
+import sys
+
+from main import SessionLocal, User, rebuild_task_stats
+
+
+def rebuild_stats(args):
+    db = SessionLocal()
+    try:
+        owner_id = None
+        if args.user:
+            user = db.query(User).filter(User.username == args.user).first()
+            if not user:
+                print(f"❌ 用户不存在: {args.user}")
+                return 1
+            owner_id = user.id
+        total = rebuild_task_stats(db, owner_id)
+        db.commit()
+        print(f"✅ 已重新统计 {total} 个任务")
+        return 0
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vibe 后端运维命令")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = commands.add_parser("rebuild-stats", help="按任务表重建仪表盘统计计数器")
+    rebuild.add_argument("--user", help="只重建这个用户名的统计")
+    rebuild.set_defaults(handler=rebuild_stats)
+
+    args = parser.parse_args()
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
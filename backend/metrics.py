@@ -0,0 +1,157 @@
+# 文件路径: backend/metrics.py
+# 进程内指标：计数器、直方图和抓取时才计算的回调指标，按 Prometheus 文本格式输出（/metrics）
+#
+# 每个 worker 进程各有一份，多 worker 部署时让 Prometheus 分别抓取每个进程再聚合。
+# 标签值按位置传，顺序和注册时的 labelnames 一致：
+#   REQUESTS = metrics.counter("http_requests_total", "请求数", ["method", "route"])
+#   REQUESTS.inc("GET", "/tasks/")
+
+import math
+import threading
+from bisect import bisect_left
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(pairs) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value) -> str:
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(value)
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, label_values) -> tuple:
+        if len(label_values) != len(self.labelnames):
+            raise ValueError(f"{self.name} 需要标签 {self.labelnames}，收到 {label_values}")
+        return tuple(str(value) for value in label_values)
+
+    def _labels(self, key, extra=()):
+        return list(zip(self.labelnames, key)) + list(extra)
+
+    def header(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.type}"
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, *label_values, amount: float = 1):
+        key = self._key(label_values)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        yield from self.header()
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self._labels(key))} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *label_values):
+        key = self._key(label_values)
+        # 每个桶只记落在 (上一个边界, 本边界] 里的次数，输出时再累加
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def collect(self):
+        yield from self.header()
+        with self._lock:
+            items = [(key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items()]
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self._labels(key, [("le", _format_value(float(bound)))]))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self._labels(key))
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+class CallbackMetric(_Metric):
+    """抓取时调用 func() 取值，func 返回 [(标签值元组, 数值)]，适合缓存大小、连接数这类现成的状态"""
+
+    def __init__(self, name: str, help: str, type: str, labelnames, func):
+        super().__init__(name, help, labelnames)
+        self.type = type
+        self.func = func
+
+    def collect(self):
+        yield from self.header()
+        for label_values, value in self.func():
+            yield f"{self.name}{_format_labels(self._labels(self._key(label_values)))} {_format_value(value)}"
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            # 同名指标只注册一次（模块被重复导入时直接复用）
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help: str, labelnames=()) -> Counter:
+    return REGISTRY.register(Counter(name, help, labelnames))
+
+
+def histogram(name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help, labelnames, buckets))
+
+
+def callback(name: str, help: str, type: str = "gauge", labelnames=(), func=None) -> CallbackMetric:
+    return REGISTRY.register(CallbackMetric(name, help, type, labelnames, func))
+
+
+def render() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,151 @@
+# 文件路径: backend/search.py
+# 任务全文检索：SQLite 用 FTS5，Postgres 用 tsvector + GIN
+#
+# 中文没有空格分词，数据库自带的分词器会把一整句中文当成一个词。
+# 所以写入索引前先在 Python 里切词：中文按单字 + 相邻两字（bigram）切开，
+# 英文/数字按单词切开并转小写，再用空格拼起来交给数据库的简单分词器。
+# 查询时中文按 bigram（单字查询用单字）、英文按前缀匹配，所有词 AND 在一起。
+
+import re
+
+from sqlalchemy import text
+
+# 中日韩文字（CJK 统一表意文字、扩展 A、兼容表意文字、假名、韩文音节）
+_CJK = r"\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af"
+_TOKEN_RE = re.compile(rf"[{_CJK}]+|[^\W_{_CJK}]+")
+_CJK_RE = re.compile(rf"[{_CJK}]")
+
+FTS_TABLE = "tasks_fts"
+PG_TABLE = "task_search"
+
+
+def _is_cjk(run: str) -> bool:
+    return bool(_CJK_RE.match(run))
+
+
+def tokenize_for_index(*texts) -> str:
+    tokens = []
+    for value in texts:
+        for run in _TOKEN_RE.findall((value or "").lower()):
+            if _is_cjk(run):
+                tokens.extend(run)
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+            else:
+                tokens.append(run)
+    return " ".join(tokens)
+
+
+def tokenize_query(query: str):
+    """返回 [(词, 是否前缀匹配)]，中文不做前缀匹配"""
+    terms = []
+    for run in _TOKEN_RE.findall((query or "").lower()):
+        if _is_cjk(run):
+            if len(run) == 1:
+                terms.append((run, False))
+            else:
+                terms.extend((run[i:i + 2], False) for i in range(len(run) - 1))
+        else:
+            terms.append((run, True))
+    return terms
+
+
+def _dialect(db) -> str:
+    return db.get_bind().dialect.name
+
+
+def is_supported(dialect_name: str) -> bool:
+    return dialect_name in ("sqlite", "postgresql")
+
+
+def ensure_index(engine) -> bool:
+    """创建索引结构，返回 True 表示是新建的（需要回填已有任务）"""
+    dialect_name = engine.dialect.name
+    if not is_supported(dialect_name):
+        return False
+    with engine.begin() as conn:
+        if dialect_name == "sqlite":
+            exists = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {"name": FTS_TABLE},
+            ).first()
+            if exists:
+                return False
+            # owner 列存成 "u<id>" 参与匹配，查询时用列过滤把范围限定在当前用户
+            conn.exec_driver_sql(
+                f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(body, owner, tokenize = 'unicode61')"
+            )
+            return True
+
+        exists = conn.execute(text("SELECT to_regclass(:name)"), {"name": PG_TABLE}).scalar()
+        if exists:
+            return False
+        conn.exec_driver_sql(
+            f"CREATE TABLE {PG_TABLE} (task_id INTEGER PRIMARY KEY, owner_id INTEGER NOT NULL, body TEXT NOT NULL)"
+        )
+        conn.exec_driver_sql(f"CREATE INDEX ix_{PG_TABLE}_owner ON {PG_TABLE} (owner_id)")
+        conn.exec_driver_sql(
+            f"CREATE INDEX ix_{PG_TABLE}_body ON {PG_TABLE} USING GIN (to_tsvector('simple', body))"
+        )
+        return True
+
+
+def index_tasks(db, tasks):
+    """在当前事务里写入/覆盖任务的索引，任务需已 flush（有 id）"""
+    dialect_name = _dialect(db)
+    if not is_supported(dialect_name) or not tasks:
+        return
+    rows = [
+        {"id": task.id, "owner_id": task.owner_id, "body": tokenize_for_index(task.content, task.category)}
+        for task in tasks
+    ]
+    if dialect_name == "sqlite":
+        db.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), rows)
+        db.execute(
+            text(f"INSERT INTO {FTS_TABLE} (rowid, body, owner) VALUES (:id, :body, 'u' || :owner_id)"),
+            rows,
+        )
+    else:
+        db.execute(
+            text(
+                f"INSERT INTO {PG_TABLE} (task_id, owner_id, body) VALUES (:id, :owner_id, :body) "
+                "ON CONFLICT (task_id) DO UPDATE SET owner_id = EXCLUDED.owner_id, body = EXCLUDED.body"
+            ),
+            rows,
+        )
+
+
+def remove_tasks(db, task_ids):
+    dialect_name = _dialect(db)
+    if not is_supported(dialect_name) or not task_ids:
+        return
+    rows = [{"id": task_id} for task_id in task_ids]
+    if dialect_name == "sqlite":
+        db.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), rows)
+    else:
+        db.execute(text(f"DELETE FROM {PG_TABLE} WHERE task_id = :id"), rows)
+
+
+def search_task_ids(db, owner_id: int, query: str, limit: int, offset: int = 0):
+    """按相关度排序返回任务 id；数据库不支持或查询里没有可用词时返回 None"""
+    dialect_name = _dialect(db)
+    terms = tokenize_query(query)
+    if not is_supported(dialect_name) or not terms:
+        return None
+
+    params = {"owner_id": owner_id, "limit": limit, "offset": offset}
+    if dialect_name == "sqlite":
+        match = " AND ".join(f'"{term}"' + ("*" if prefix else "") for term, prefix in terms)
+        params["match"] = f'owner : "u{owner_id}" AND body : ({match})'
+        sql = (
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match "
+            f"ORDER BY bm25({FTS_TABLE}, 1.0, 0.0), rowid LIMIT :limit OFFSET :offset"
+        )
+    else:
+        params["tsquery"] = " & ".join(f"'{term}'" + (":*" if prefix else "") for term, prefix in terms)
+        sql = (
+            f"SELECT task_id FROM {PG_TABLE} "
+            "WHERE owner_id = :owner_id AND to_tsvector('simple', body) @@ to_tsquery('simple', :tsquery) "
+            "ORDER BY ts_rank(to_tsvector('simple', body), to_tsquery('simple', :tsquery)) DESC, task_id "
+            "LIMIT :limit OFFSET :offset"
+        )
+    return [row[0] for row in db.execute(text(sql), params)]
@@ -49,9 +49,10 @@ function App() {
     toggleTask,
     deleteTask,
     editTask,
-    updateTasksSort,
+    moveTask,
     createTask,
-    fetchCurrentUser
+    fetchCurrentUser,
+    subscribeTaskEvents
   } = useStore()
   
   const toast = useToast()
@@ -72,6 +73,12 @@ function App() {
     }
   }, [token, fetchTasks, fetchCurrentUser, toast])
 
+  // 订阅任务变更推送，退出登录或卸载时关闭连接
+  useEffect(() => {
+    if (!token) return
+    return subscribeTaskEvents()
+  }, [token, subscribeTaskEvents])
+
   // === 2. 提交新任务 (普通提交) ===
   const handleSubmit = async (e) => {
     e.preventDefault() // 兼容直接调用
@@ -300,7 +307,7 @@ function App() {
                   toggleTask={toggleTask} 
                   deleteTask={deleteTask} 
                   editTask={editTask}
-                  updateTasksSort={updateTasksSort}
+                  moveTask={moveTask}
                 />
               </TabPanel>
               {/* 仪表盘 */}
@@ -88,26 +88,42 @@ export const auth = {
 
 // 任务管理
 export const tasks = {
-  // 获取任务列表
-  getTasks: () => api.get('/tasks/'),
+  // 获取任务列表（可选筛选参数：category / priority / is_done / deadline / cursor / limit）
+  getTasks: (params) => api.get('/tasks/', { params }),
+  // 增量同步：获取版本号 since 之后的变更
+  getChanges: (since) => api.get('/tasks/changes', { params: { since } }),
+  // 仪表盘统计（按状态 / 分类 / 优先级 / 截止日期汇总）
+  getStats: () => api.get('/tasks/stats'),
+  // 全文检索任务（按相关度排序）
+  searchTasks: (q, params) => api.get('/tasks/search', { params: { q, ...params } }),
   // 创建任务
   createTask: (data) => api.post('/tasks/', data),
   // 更新任务
   updateTask: (id, data) => api.put(`/tasks/${id}`, data),
   // 批量更新任务排序
   updateTasksSort: (tasks) => api.put('/tasks/sort', tasks),
+  // 拖拽单个任务：只传目标位置前后的邻居
+  moveTask: (id, neighbors) => api.put(`/tasks/${id}/move`, neighbors),
   // 删除任务
   deleteTask: (id) => api.delete(`/tasks/${id}`),
-  // 导出任务
-  exportTasks: () => api.get('/tasks/export'),
+  // 导出任务（format: json / ndjson / csv）
+  exportTasks: (format = 'json') => api.get('/tasks/export', { params: { format } }),
   // 导入任务
   importTasks: (tasks) => api.post('/tasks/import', tasks),
+  // 流式导入大文件：直接把文件作为请求体上传（format: ndjson / csv）
+  importTasksStream: (file, format = 'ndjson') => api.post('/tasks/import/stream', file, {
+    params: { format },
+    headers: { 'Content-Type': format === 'csv' ? 'text/csv' : 'application/x-ndjson' },
+    timeout: 0
+  }),
 }
 
 // AI 服务
 export const ai = {
   // AI 任务分析
   analyzeTask: (data) => api.post('/ai/analyze', data),
+  // 批量分析多条文本（返回 NDJSON，每行一条结果）
+  analyzeBatch: (data) => api.post('/ai/analyze/batch', data, { responseType: 'text', timeout: 0 }),
 }
 
 // 用户信息
@@ -1,6 +1,6 @@
 // src/components/Dashboard.jsx
 // 数据可视化仪表盘
-import React from 'react'
+import React, { useEffect, useState } from 'react'
 import {
   Box, VStack, HStack, Text, Heading, Card, CardBody,
   CardHeader, Stat, StatLabel, StatNumber, StatHelpText,
@@ -11,29 +11,42 @@ import {
   ResponsiveContainer, PieChart, Pie, Cell
 } from 'recharts'
 import useStore from '../store'
+import { tasks as tasksApi } from '../api'
 import TaskExportImport from './TaskExportImport'
 
 // 定义颜色常量
 const COLORS = ['#8884d8', '#82ca9d', '#ffc658', '#ff8042', '#0088FE']
 
+const EMPTY_STATS = {
+  total: 0,
+  done: 0,
+  pending: 0,
+  by_category: {},
+  by_priority: {},
+  deadline: { overdue: 0, today: 0, week: 0 }
+}
+
 function Dashboard() {
-  const { tasks } = useStore()
+  // 任务有变更（版本号变化）时重新拉取服务端统计，不需要下载全部任务
+  const { taskVersion } = useStore()
+  const [stats, setStats] = useState(EMPTY_STATS)
+
+  useEffect(() => {
+    let cancelled = false
+    tasksApi.getStats()
+      .then((data) => { if (!cancelled) setStats(data) })
+      .catch((error) => console.error('获取任务统计失败:', error))
+    return () => { cancelled = true }
+  }, [taskVersion])
   
   // 统计任务数据
-  const totalTasks = tasks.length
-  const completedTasks = tasks.filter(task => task.is_done).length
-  const pendingTasks = totalTasks - completedTasks
+  const totalTasks = stats.total
+  const completedTasks = stats.done
+  const pendingTasks = stats.pending
   const completionRate = totalTasks > 0 ? Math.round((completedTasks / totalTasks) * 100) : 0
   
-  // 按分类统计任务
-  const categoryStats = tasks.reduce((acc, task) => {
-    const category = task.category || '其他'
-    acc[category] = (acc[category] || 0) + 1
-    return acc
-  }, {})
-  
   // 转换为饼图数据格式
-  const pieData = Object.entries(categoryStats).map(([name, value]) => ({
+  const pieData = Object.entries(stats.by_category).map(([name, value]) => ({
     name,
     value
   }))
@@ -108,6 +121,18 @@ function Dashboard() {
             </CardBody>
           </Card>
         </GridItem>
+        
+        <GridItem>
+          <Card shadow="sm" borderLeft="4px solid" borderLeftColor="red.500">
+            <CardBody>
+              <Stat>
+                <StatLabel>已过期</StatLabel>
+                <StatNumber>{stats.deadline.overdue}</StatNumber>
+                <StatHelpText>今天到期 {stats.deadline.today} · 本周 {stats.deadline.week}</StatHelpText>
+              </Stat>
+            </CardBody>
+          </Card>
+        </GridItem>
       </Grid>
       
       {/* 图表区域 */}
@@ -92,7 +92,7 @@ const SortableItem = React.memo(({ id, children }) => {
   )
 })
 
-const TaskList = React.memo(({ tasks, filterCategory, filterPriority, filterDeadline, searchQuery, toggleTask, deleteTask, editTask, updateTasksSort }) => {
+const TaskList = React.memo(({ tasks, filterCategory, filterPriority, filterDeadline, searchQuery, toggleTask, deleteTask, editTask, moveTask }) => {
   // 编辑状态：当前正在编辑的任务
   const [editingTask, setEditingTask] = useState(null)
   const [editingContent, setEditingContent] = useState('')
@@ -154,17 +154,16 @@ const TaskList = React.memo(({ tasks, filterCategory, filterPriority, filterDead
       const newIndex = filteredTasks.findIndex((task) => task.id.toString() === over.id)
       
       if (oldIndex !== -1 && newIndex !== -1) {
-        // 重新排列任务
+        // 重新排列任务，找出被拖动任务在新位置前后的邻居
         const reorderedTasks = arrayMove(filteredTasks, oldIndex, newIndex)
+        const prevTask = reorderedTasks[newIndex - 1]
+        const nextTask = reorderedTasks[newIndex + 1]
         
-        // 准备批量更新的数据
-        const tasksData = reorderedTasks.map((task, index) => ({
-          id: task.id,
-          sort_order: index
-        }))
-        
-        // 调用批量更新排序的方法
-        updateTasksSort(tasksData)
+        // 只提交这一个任务的新位置，后端只更新这一行
+        moveTask(filteredTasks[oldIndex].id, {
+          prev_id: prevTask ? prevTask.id : null,
+          next_id: nextTask ? nextTask.id : null
+        })
       }
     }
   }
@@ -19,6 +19,7 @@ const useStore = create((set, get) => ({
   
   // === 2. 任务状态 ===
   tasks: [],
+  taskVersion: 0, // 已同步到的任务变更版本号
   isLoading: false,
   
   // === 3. 新任务状态 ===
@@ -47,7 +48,7 @@ const useStore = create((set, get) => ({
   // 清除 token (退出登录)
   clearToken: () => {
     localStorage.removeItem('vibe_token')
-    set({ token: null, tasks: [], newTask: '', aiPrompt: '', username: null, avatar_url: null })
+    set({ token: null, tasks: [], taskVersion: 0, newTask: '', aiPrompt: '', username: null, avatar_url: null })
   },
   
   // 获取当前用户信息
@@ -106,28 +107,66 @@ const useStore = create((set, get) => ({
   
   // === 6. 任务操作方法 ===
   
-  // 获取任务列表
+  // 获取任务列表（全量）
   fetchTasks: async () => {
-    const { token } = get()
+    const { token, syncTasks } = get()
     if (!token) return
     
-    set({ isLoading: true })
+    set({ isLoading: true, taskVersion: 0 })
     try {
-      const data = await tasks.getTasks()
-      if (Array.isArray(data)) {
-        set({ tasks: data })
-      }
+      await syncTasks()
+    } finally {
+      set({ isLoading: false })
+    }
+  },
+  
+  // 增量同步：只拉取上次同步之后变化的任务，合并到本地列表
+  syncTasks: async () => {
+    const { token, taskVersion } = get()
+    if (!token) return
+    
+    try {
+      const data = await tasks.getChanges(taskVersion)
+      if (!data || !Array.isArray(data.tasks)) return
+      set((state) => {
+        // taskVersion 为 0 时是全量结果，直接替换
+        const byId = new Map(taskVersion ? state.tasks.map((task) => [task.id, task]) : [])
+        data.tasks.forEach((task) => byId.set(task.id, task))
+        data.deleted.forEach((id) => byId.delete(id))
+        const merged = Array.from(byId.values()).sort(
+          (a, b) => (a.sort_order - b.sort_order) || (a.id - b.id)
+        )
+        return { tasks: merged, taskVersion: data.version }
+      })
     } catch (err) {
       console.error('获取任务失败:', err)
       throw err
-    } finally {
-      set({ isLoading: false })
     }
   },
   
+  // 订阅任务变更事件（SSE），其他标签页/设备改了任务时自动增量同步
+  // 返回取消订阅函数
+  subscribeTaskEvents: () => {
+    const { token } = get()
+    if (!token) return () => {}
+    
+    const source = new EventSource(`${API_URL}/tasks/events?token=${encodeURIComponent(token)}`)
+    source.onmessage = (e) => {
+      const event = JSON.parse(e.data)
+      const { taskVersion, fetchTasks, syncTasks } = get()
+      if (event.type === 'resync') {
+        // 推送积压太多被服务端丢弃，重新拉一次全量
+        fetchTasks().catch(() => {})
+      } else if (event.version > taskVersion) {
+        syncTasks().catch(() => {})
+      }
+    }
+    return () => source.close()
+  },
+  
   // 创建新任务
   createTask: async () => {
-    const { newTask, newTaskCategory, newTaskPriority, newTaskDeadline, fetchTasks } = get()
+    const { newTask, newTaskCategory, newTaskPriority, newTaskDeadline, syncTasks } = get()
     if (!newTask.trim()) return
     
     set({ isLoading: true })
@@ -138,7 +177,7 @@ const useStore = create((set, get) => ({
         priority: newTaskPriority,
         deadline: newTaskDeadline
       })
-      await fetchTasks()
+      await syncTasks()
       set({ 
         newTask: '', 
         newTaskCategory: '日常',
@@ -158,11 +197,11 @@ const useStore = create((set, get) => ({
   
   // 更新任务状态
   updateTask: async (id, data) => {
-    const { fetchTasks } = get()
+    const { syncTasks } = get()
     set({ isLoading: true })
     try {
       await tasks.updateTask(id, data)
-      await fetchTasks()
+      await syncTasks()
     } catch (err) {
       console.error('更新任务失败:', err)
       throw err
@@ -179,11 +218,11 @@ const useStore = create((set, get) => ({
   
   // 删除任务
   deleteTask: async (id) => {
-    const { fetchTasks } = get()
+    const { syncTasks } = get()
     set({ isLoading: true })
     try {
       await tasks.deleteTask(id)
-      await fetchTasks()
+      await syncTasks()
     } catch (err) {
       console.error('删除任务失败:', err)
       throw err
@@ -194,11 +233,11 @@ const useStore = create((set, get) => ({
   
   // 批量更新任务排序
   updateTasksSort: async (tasksData) => {
-    const { fetchTasks } = get()
+    const { syncTasks } = get()
     set({ isLoading: true })
     try {
       await tasks.updateTasksSort(tasksData)
-      await fetchTasks()
+      await syncTasks()
     } catch (err) {
       console.error('更新任务排序失败:', err)
       throw err
@@ -207,13 +246,28 @@ const useStore = create((set, get) => ({
     }
   },
   
+  // 拖拽移动单个任务（neighbors: { prev_id, next_id }）
+  moveTask: async (id, neighbors) => {
+    const { syncTasks } = get()
+    set({ isLoading: true })
+    try {
+      await tasks.moveTask(id, neighbors)
+      await syncTasks()
+    } catch (err) {
+      console.error('移动任务失败:', err)
+      throw err
+    } finally {
+      set({ isLoading: false })
+    }
+  },
+  
   // 编辑任务
   editTask: async (id, data) => {
-    const { fetchTasks } = get()
+    const { syncTasks } = get()
     set({ isLoading: true })
     try {
       await tasks.updateTask(id, data)
-      await fetchTasks()
+      await syncTasks()
     } catch (err) {
       console.error('编辑任务失败:', err)
       throw err
@@ -311,11 +365,11 @@ const useStore = create((set, get) => ({
   
   // 导入任务
   importTasks: async (tasksData) => {
-    const { isLoading, fetchTasks } = get()
+    const { isLoading, syncTasks } = get()
     set({ isLoading: true })
     try {
       const result = await tasks.importTasks(tasksData)
-      await fetchTasks()
+      await syncTasks()
       return result
     } catch (err) {
       console.error('导入任务失败:', err)